@@ -0,0 +1,145 @@
+import gc
+import sys
+import json
+import time
+import resource
+import multiprocessing
+
+from libcrawler import crawlerfactory
+from bench import pagecorpus
+
+"""
+    Replays the recorded page corpus offline through each vendor's parsers, checking
+    results still match what was recorded and reporting throughput, allocations and
+    peak rss growth. Throughput is compared against the stored baseline, any mismatch or
+    slowdown past regression_tolerance fails the run.
+    Usage: python -m bench.crawlerbench [--save-baseline] [vendor_id]...
+"""
+
+iterations           = 10
+regression_tolerance = 0.2
+baseline_path        = pagecorpus.fixtures_dir + "/baseline.json"
+
+
+def normalise(result):
+    """ Round trips a result through json so it compares equal to the recorded one. """
+    return json.loads(json.dumps(result))
+
+
+def check_pages(crawler, pages):
+    """ Returns files of pages whose extracted results no longer match the recorded ones. """
+    mismatched_files = []
+
+    for page, page_text in pages:
+        if normalise(pagecorpus.run_page(crawler, page, page_text)) != page["expected"]:
+            mismatched_files.append(page["file"])
+
+    return mismatched_files
+
+
+def measure_pages_per_sec(crawler, pages):
+    start_time = time.time()
+
+    for idx in range(iterations):
+        for page, page_text in pages:
+            pagecorpus.run_page(crawler, page, page_text)
+
+    return len(pages) * iterations / (time.time() - start_time)
+
+
+def measure_allocs_per_page(crawler, pages):
+    """ Net gc-tracked objects allocated per page, with collection off so parse trees aren't freed early. """
+    gc.disable()
+    gc.collect()
+    start_count = gc.get_count()[0]
+
+    for page, page_text in pages:
+        pagecorpus.run_page(crawler, page, page_text)
+
+    allocs = gc.get_count()[0] - start_count
+    gc.enable()
+    gc.collect()
+
+    return allocs / len(pages)
+
+
+def measure_peak_rss(crawler, pages, result_queue):
+    """ Run in a fresh process so the max rss growth is down to one pass over the pages. """
+    start_max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    for page, page_text in pages:
+        pagecorpus.run_page(crawler, page, page_text)
+
+    result_queue.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_max_rss)
+
+
+def bench_vendor(crawler):
+    """ Returns (num pages, mismatched files, pages/sec, allocs/page, peak rss growth KB) for a vendor's corpus. """
+    manifest = pagecorpus.load_manifest(crawler.vendor_id)
+    pages    = [(page, pagecorpus.read_page(crawler.vendor_id, page)) for page in manifest["pages"]]
+
+    if not pages:
+        return 0, [], None, None, None
+
+    mismatched_files = check_pages(crawler, pages)
+    pages_per_sec    = measure_pages_per_sec(crawler, pages)
+    allocs_per_page  = measure_allocs_per_page(crawler, pages)
+
+    result_queue  = multiprocessing.Queue()
+    rss_process   = multiprocessing.Process(target=measure_peak_rss, args=(crawler, pages, result_queue))
+    rss_process.start()
+    rss_growth_kb = result_queue.get()
+    rss_process.join()
+
+    return len(pages), mismatched_files, pages_per_sec, allocs_per_page, rss_growth_kb
+
+
+save_baseline = "--save-baseline" in sys.argv
+vendor_ids    = [int(arg) for arg in sys.argv[1:] if arg != "--save-baseline"]
+crawler_fact  = crawlerfactory.CrawlerFactory(None)
+failed        = False
+
+if not vendor_ids:
+    vendor_ids = sorted(crawler_fact.crawler_map.keys())
+
+try:
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+except IOError:
+    baseline = {}
+
+print "%-22s %6s %10s %12s %13s %10s  %s" % ("crawler", "pages", "pages/sec", "allocs/page", "rss growth KB",
+                                             "baseline", "status")
+
+for vendor_id in vendor_ids:
+    crawler = crawler_fact.get_crawler(vendor_id)
+    num_pages, mismatched_files, pages_per_sec, allocs_per_page, rss_growth_kb = bench_vendor(crawler)
+
+    if num_pages == 0:
+        print "%-22s %6d  no recorded pages" % (crawler.__class__.__name__, 0)
+        continue
+
+    baseline_pages_per_sec = baseline.get(str(vendor_id))
+    status                 = "ok"
+
+    if mismatched_files:
+        status = "MISMATCH: " + ", ".join(mismatched_files)
+        failed = True
+    elif baseline_pages_per_sec is not None and pages_per_sec < baseline_pages_per_sec * (1 - regression_tolerance):
+        status = "REGRESSION"
+        failed = True
+
+    print "%-22s %6d %10.1f %12d %13d %10s  %s" % (crawler.__class__.__name__, num_pages, pages_per_sec,
+                                                   allocs_per_page, rss_growth_kb,
+                                                   "-" if baseline_pages_per_sec is None else
+                                                   "%.1f" % baseline_pages_per_sec, status)
+
+    if save_baseline:
+        baseline[str(vendor_id)] = pages_per_sec
+
+if save_baseline:
+    with open(baseline_path, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+if failed:
+    sys.exit(1)
@@ -0,0 +1,100 @@
+import sys
+import datetime
+import decimal
+import resource
+import multiprocessing
+
+from libcrawler import libcrawler
+
+"""
+    Compares the memory held per event (with its tickets) by the slotted EventInfo &
+    TicketInfo against dict-backed equivalents, like the refresher & web pages hold them.
+    Usage: python -m bench.memorybench [events] [tickets per event]
+"""
+
+
+class DictEventInfo:
+    """ EventInfo as it was before __slots__. """
+
+    def __init__(self, vendor_id, event_type_id, event_name, url):
+        self.vendor_id        = vendor_id
+        self.event_type_id    = event_type_id
+        self.event_name       = event_name
+        self.url              = url
+        self.venue_name       = None
+        self.venue_state      = None
+        self.event_datetime   = None
+        self.invalid          = None
+        self.vendor_event_id  = None
+        self.ticket_list      = []
+
+
+class DictTicketInfo:
+    """ TicketInfo as it was before __slots__. """
+
+    def __init__(self, ticket_num, ticket_type, ticket_price, booking_fee, sold_out):
+        self.ticket_num   = ticket_num
+        self.ticket_type  = ticket_type
+        self.ticket_price = ticket_price
+        self.booking_fee  = booking_fee
+        self.sold_out     = sold_out
+
+
+record_types = [("dict", DictEventInfo, DictTicketInfo),
+                ("slots", libcrawler.EventInfo, libcrawler.TicketInfo)]
+
+
+def build_events(event_class, ticket_class, num_events, num_tickets):
+    event_list     = []
+    event_datetime = datetime.datetime(2014, 1, 1, 20, 0)
+    ticket_price   = decimal.Decimal("49.90")
+    booking_fee    = decimal.Decimal("5.50")
+
+    for idx in range(num_events):
+        event_info = event_class(1, 1, u"Event", u"http://www.example.com/event/" + str(idx))
+        event_info.venue_state     = u"NSW"
+        event_info.event_datetime  = event_datetime
+        event_info.vendor_event_id = idx
+
+        for ticket_num in range(1, num_tickets + 1):
+            event_info.ticket_list.append(ticket_class(ticket_num, u"General Admission", ticket_price, booking_fee,
+                                                       None))
+
+        event_list.append(event_info)
+
+    return event_list
+
+
+def measure_peak_mem(event_class, ticket_class, num_events, num_tickets, result_queue):
+    """ Run in a fresh process so the max rss growth is down to the events built. """
+    start_max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    event_list    = build_events(event_class, ticket_class, num_events, num_tickets)
+    result_queue.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_max_rss)
+
+
+def bench_record_type(event_class, ticket_class, num_events, num_tickets):
+    """ Returns the peak memory growth in KB of holding the events at once. """
+    result_queue = multiprocessing.Queue()
+    mem_process  = multiprocessing.Process(target=measure_peak_mem,
+                                           args=(event_class, ticket_class, num_events, num_tickets, result_queue))
+    mem_process.start()
+    peak_mem_kb  = result_queue.get()
+    mem_process.join()
+
+    return peak_mem_kb
+
+
+num_events  = 100000
+num_tickets = 3
+
+if len(sys.argv) > 1:
+    num_events = int(sys.argv[1])
+if len(sys.argv) > 2:
+    num_tickets = int(sys.argv[2])
+
+print "events: " + str(num_events) + ", tickets per event: " + str(num_tickets)
+print "%-10s %12s %16s" % ("records", "peak KB", "bytes per event")
+
+for name, event_class, ticket_class in record_types:
+    peak_mem_kb = bench_record_type(event_class, ticket_class, num_events, num_tickets)
+    print "%-10s %12d %16d" % (name, peak_mem_kb, peak_mem_kb * 1024 / num_events)
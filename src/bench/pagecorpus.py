@@ -0,0 +1,105 @@
+import os
+import json
+import codecs
+from datetime import datetime
+
+from libcrawler import libcrawler
+
+"""
+    Corpus of recorded vendor pages used by the crawler benchmark & regression suite.
+    Each vendor has a directory under bench/fixtures holding the saved pages and a
+    manifest.json listing them along with what the parsers extracted when recorded.
+"""
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+datetime_format = "%Y-%m-%dT%H:%M:%S"
+
+
+def vendor_dir(vendor_id):
+    return os.path.join(fixtures_dir, str(vendor_id))
+
+
+def load_manifest(vendor_id):
+    """ Returns a vendor's manifest, or an empty one if it has no recorded pages yet. """
+    manifest_path = os.path.join(vendor_dir(vendor_id), "manifest.json")
+
+    if not os.path.exists(manifest_path):
+        return {"vendor_id": vendor_id, "pages": []}
+
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(manifest):
+    if not os.path.isdir(vendor_dir(manifest["vendor_id"])):
+        os.makedirs(vendor_dir(manifest["vendor_id"]))
+
+    with open(os.path.join(vendor_dir(manifest["vendor_id"]), "manifest.json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+
+def read_page(vendor_id, page):
+    with codecs.open(os.path.join(vendor_dir(vendor_id), page["file"]), "r", "utf-8") as page_file:
+        return page_file.read()
+
+
+def write_page(vendor_id, page, page_text):
+    with codecs.open(os.path.join(vendor_dir(vendor_id), page["file"]), "w", "utf-8") as page_file:
+        page_file.write(page_text)
+
+
+def event_info_to_dict(event_info):
+    event_datetime = None
+    if event_info.event_datetime is not None:
+        event_datetime = event_info.event_datetime.strftime(datetime_format)
+
+    return {"vendor_id":      event_info.vendor_id,
+            "event_type_id":  event_info.event_type_id,
+            "event_name":     event_info.event_name,
+            "url":            event_info.url,
+            "venue_name":     event_info.venue_name,
+            "venue_state":    event_info.venue_state,
+            "event_datetime": event_datetime}
+
+
+def event_info_from_dict(event_dict):
+    event_info = libcrawler.EventInfo(event_dict["vendor_id"], event_dict["event_type_id"],
+                                      event_dict["event_name"], event_dict["url"])
+    event_info.venue_name  = event_dict.get("venue_name")
+    event_info.venue_state = event_dict["venue_state"]
+
+    if event_dict["event_datetime"] is not None:
+        event_info.event_datetime = datetime.strptime(event_dict["event_datetime"], datetime_format)
+
+    return event_info
+
+
+def run_search_page(crawler, page, page_text):
+    """ Replays a search page through the crawler's parsers, returning what was extracted. """
+    result = {"events": [event_info_to_dict(event_info) for event_info in
+                         crawler.extract_new_events(page["event_type_id"], set(), page_text)]}
+
+    if page["paginated"]:
+        result["subsequent_urls"] = crawler.extract_subsequent_urls(page_text)
+
+    return result
+
+
+def run_event_page(crawler, page, page_text):
+    """ Replays an event page through the crawler's parser, returning what was extracted. """
+    event_info = event_info_from_dict(page["event"])
+    crawler.extract_ticket_info(event_info, page_text)
+
+    result = event_info_to_dict(event_info)
+    result["invalid"] = event_info.invalid
+    result["tickets"] = [[ticket_info.ticket_num, ticket_info.ticket_type, str(ticket_info.ticket_price),
+                          str(ticket_info.booking_fee), ticket_info.sold_out] for ticket_info in event_info.ticket_list]
+
+    return result
+
+
+def run_page(crawler, page, page_text):
+    if page["type"] == "search":
+        return run_search_page(crawler, page, page_text)
+    else:
+        return run_event_page(crawler, page, page_text)
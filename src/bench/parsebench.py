@@ -0,0 +1,66 @@
+import sys
+import time
+import codecs
+import resource
+import multiprocessing
+
+from libcrawler import crawlerfactory, libcrawler, parsing
+
+"""
+    Compares event page parse time & peak memory with and without partial parsing.
+    Usage: python -m bench.parsebench <vendor_id> <saved event page>...
+"""
+
+iterations = 20
+
+
+def parse_page(crawler, event_page):
+    event_info = libcrawler.EventInfo(crawler.vendor_id, None, "bench", "bench")
+    crawler.extract_ticket_info(event_info, event_page)
+
+
+def measure_peak_mem(crawler, event_page, result_queue):
+    """ Run in a fresh process so the max rss growth is down to this one parse. """
+    start_max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    parse_page(crawler, event_page)
+    result_queue.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_max_rss)
+
+
+def bench_page(crawler, event_page):
+    """ Returns (average parse sec, peak memory growth in KB) for the current parsing mode. """
+    parse_page(crawler, event_page)  # warm up
+    start_time = time.time()
+
+    for idx in range(iterations):
+        parse_page(crawler, event_page)
+
+    parse_sec    = (time.time() - start_time) / iterations
+    result_queue = multiprocessing.Queue()
+    mem_process  = multiprocessing.Process(target=measure_peak_mem, args=(crawler, event_page, result_queue))
+    mem_process.start()
+    peak_mem_kb  = result_queue.get()
+    mem_process.join()
+
+    return parse_sec, peak_mem_kb
+
+
+if len(sys.argv) < 3:
+    print "Usage: python -m bench.parsebench <vendor_id> <saved event page>..."
+    print "Exiting.."
+    sys.exit(0)
+
+crawler = crawlerfactory.CrawlerFactory(None).get_crawler(int(sys.argv[1]))
+
+print "parser: " + parsing.parser_name + ", iterations: " + str(iterations)
+print "%-40s %12s %12s %12s %12s" % ("page", "full ms", "partial ms", "full KB", "partial KB")
+
+for page_path in sys.argv[2:]:
+    with codecs.open(page_path, "r", "utf-8") as page_file:
+        event_page = page_file.read()
+
+    parsing.partial_parsing = False
+    full_sec, full_kb = bench_page(crawler, event_page)
+    parsing.partial_parsing = True
+    partial_sec, partial_kb = bench_page(crawler, event_page)
+
+    print "%-40s %12.2f %12.2f %12d %12d" % (page_path[-40:], full_sec * 1000, partial_sec * 1000, full_kb, partial_kb)
@@ -0,0 +1,49 @@
+import sys
+
+from libcrawler import crawlerfactory
+from bench import pagecorpus
+
+"""
+    Records a vendor search page plus the event pages it lists into the page corpus,
+    along with what the parsers currently extract from them as the expected results.
+    Usage: python -m bench.recordpages <vendor_id> <event_type_id> <search_url> <paginated Y/N> [max event pages]
+"""
+
+if len(sys.argv) not in (5, 6):
+    print "Usage: python -m bench.recordpages <vendor_id> <event_type_id> <search_url> <paginated Y/N> " + \
+        "[max event pages]"
+    print "Exiting.."
+    sys.exit(0)
+
+vendor_id       = int(sys.argv[1])
+event_type_id   = int(sys.argv[2])
+search_url      = sys.argv[3]
+paginated       = sys.argv[4] == "Y"
+max_event_pages = 10
+
+if len(sys.argv) == 6:
+    max_event_pages = int(sys.argv[5])
+
+crawler  = crawlerfactory.CrawlerFactory(None).get_crawler(vendor_id)
+manifest = pagecorpus.load_manifest(vendor_id)
+pagecorpus.save_manifest(manifest)
+
+
+def record_page(page, page_text):
+    page["file"]     = page["type"] + "_" + str(len(manifest["pages"]) + 1) + ".html"
+    page["expected"] = pagecorpus.run_page(crawler, page, page_text)
+
+    pagecorpus.write_page(vendor_id, page, page_text)
+    manifest["pages"].append(page)
+    print "Recorded " + page["url"] + " as " + page["file"]
+
+
+search_text = crawler.http_client.get(search_url).text
+record_page({"type": "search", "url": search_url, "event_type_id": event_type_id, "paginated": paginated},
+            search_text)
+
+for event_info in crawler.extract_new_events(event_type_id, set(), search_text)[:max_event_pages]:
+    record_page({"type": "event", "url": event_info.url, "event": pagecorpus.event_info_to_dict(event_info)},
+                crawler.fetch_event_url(event_info.url).text)
+
+pagecorpus.save_manifest(manifest)
@@ -56,12 +56,17 @@ CREATE TABLE ozevnts.vendor_event
   vendor_id integer NOT NULL,
   event_type_id integer NOT NULL,
   event_title text,
+  venue text,
   state text,
   event_timestamp timestamp without time zone,
   event_sys_timestamp timestamp without time zone,
   last_refreshed_timestamp timestamp without time zone NOT NULL,
+  refresh_count integer NOT NULL DEFAULT 0,
+  change_count integer NOT NULL DEFAULT 0,
+  next_refresh_timestamp timestamp without time zone,
   invalid_ind character(1),
   url text NOT NULL,
+  search_vector tsvector,
   
   CONSTRAINT vendor_event_pk PRIMARY KEY (id),
   CONSTRAINT vendor_event_fk1 FOREIGN KEY (event_type_id)
@@ -80,6 +85,20 @@ ALTER TABLE ozevnts.vendor_event OWNER TO ozevntsdev;
 GRANT SELECT, INSERT, UPDATE, DELETE ON ozevnts.vendor_event TO ozevntsapp;
 GRANT USAGE ON ozevnts.vendor_event_id_seq TO ozevntsapp;
 
+-- search indexes used by find_events: words (search_vector is kept up to date by
+-- vendor_event_search_vector_trg, see create_functions.sql) & trigram substrings
+CREATE INDEX vendor_event_search_idx ON ozevnts.vendor_event USING gin (search_vector);
+CREATE INDEX vendor_event_title_trgm_idx ON ozevnts.vendor_event USING gin (event_title gin_trgm_ops);
+CREATE INDEX vendor_event_venue_trgm_idx ON ozevnts.vendor_event USING gin (venue gin_trgm_ops);
+
+-- upcoming valid events by time, for the listing, search & refresh queries
+CREATE INDEX vendor_event_valid_ts_idx ON ozevnts.vendor_event (event_sys_timestamp) WHERE invalid_ind IS NULL;
+CREATE INDEX vendor_event_valid_type_ts_idx ON ozevnts.vendor_event (event_type_id, event_sys_timestamp) WHERE invalid_ind IS NULL;
+-- events due a refresh, see next_refresh_timestamp in create_functions.sql
+CREATE INDEX vendor_event_next_refresh_idx ON ozevnts.vendor_event (next_refresh_timestamp) WHERE invalid_ind IS NULL;
+-- incremental known url loads
+CREATE INDEX vendor_event_vendor_id_idx ON ozevnts.vendor_event (vendor_id, id);
+
 -- DROP TABLE ozevnts.vendor_event_ticket;
 CREATE TABLE ozevnts.vendor_event_ticket
 (
@@ -101,6 +120,58 @@ WITH (
 );
 ALTER TABLE ozevnts.vendor_event_ticket OWNER TO ozevntsdev;
 GRANT SELECT, INSERT, UPDATE, DELETE ON ozevnts.vendor_event_ticket TO ozevntsapp;
+
+-- unsold tickets by type, for refreshes which match tickets on type
+CREATE INDEX vendor_event_ticket_unsold_type_idx ON ozevnts.vendor_event_ticket (vendor_event_id, ticket_type)
+  WHERE sold_out_ind IS NULL;
+
+-- DROP TABLE ozevnts.vendor_event_ticket_archive;
+-- DROP TABLE ozevnts.vendor_event_archive;
+
+-- past events & their tickets, moved out of vendor_event & vendor_event_ticket by
+-- archive_past_events so queries on current events don't have to wade through them.
+-- columns must stay in the same order as the live tables, any column added to one
+-- has to be added to its archive too.
+CREATE TABLE ozevnts.vendor_event_archive
+(
+  LIKE ozevnts.vendor_event INCLUDING DEFAULTS,
+  CONSTRAINT vendor_event_archive_pk PRIMARY KEY (id)
+)
+WITH (
+  OIDS=FALSE
+);
+ALTER TABLE ozevnts.vendor_event_archive OWNER TO ozevntsdev;
+GRANT SELECT, INSERT, UPDATE, DELETE ON ozevnts.vendor_event_archive TO ozevntsapp;
+CREATE INDEX vendor_event_archive_url_idx ON ozevnts.vendor_event_archive (url);
+CREATE INDEX vendor_event_archive_vendor_id_idx ON ozevnts.vendor_event_archive (vendor_id, id);
+
+CREATE TABLE ozevnts.vendor_event_ticket_archive
+(
+  LIKE ozevnts.vendor_event_ticket INCLUDING DEFAULTS,
+  CONSTRAINT vendor_event_ticket_archive_pk PRIMARY KEY (vendor_event_id, ticket_num)
+)
+WITH (
+  OIDS=FALSE
+);
+ALTER TABLE ozevnts.vendor_event_ticket_archive OWNER TO ozevntsdev;
+GRANT SELECT, INSERT, UPDATE, DELETE ON ozevnts.vendor_event_ticket_archive TO ozevntsapp;
+
+-- DROP TABLE ozevnts.data_version;
+
+-- one row, its version bumped once by each transaction which changes vendor_event or
+-- vendor_event_ticket (see bump_data_version in create_functions.sql), used to invalidate
+-- cached pages. bumped_txid is the last transaction to bump it.
+CREATE TABLE ozevnts.data_version
+(
+  version bigint NOT NULL,
+  bumped_txid bigint
+)
+WITH (
+  OIDS=FALSE
+);
+ALTER TABLE ozevnts.data_version OWNER TO ozevntsdev;
+GRANT SELECT, UPDATE ON ozevnts.data_version TO ozevntsapp;
+insert into ozevnts.data_version(version) values(0);
     
 -- DROP TABLE ozevnts.vendor_listing;
 
@@ -110,6 +181,10 @@ CREATE TABLE ozevnts.vendor_listing
   event_type_id integer NOT NULL,
   search_url text NOT NULL,
   paginated_ind character(1),
+  last_num_pages integer,
+  last_num_new_events integer,
+  last_crawled_timestamp timestamp without time zone,
+  last_full_sweep_timestamp timestamp without time zone,
   CONSTRAINT vendor_listing_pk PRIMARY KEY (vendor_id, event_type_id, search_url),
   CONSTRAINT vendor_listing_fk1 FOREIGN KEY (vendor_id)
       REFERENCES ozevnts.vendor (id) MATCH SIMPLE
@@ -125,6 +200,34 @@ WITH (
 ALTER TABLE ozevnts.vendor_listing OWNER TO ozevntsdev;
 GRANT SELECT, INSERT, UPDATE, DELETE ON ozevnts.vendor_listing TO ozevntsapp;
 
+-- DROP TABLE ozevnts.crawl_frontier;
+
+-- search & event pages of each vendor's crawl cycle, so a crawl which dies part way through
+-- resumes where it left off rather than starting over (see crawlfrontier.py).
+-- url_type: S search page, E event page.
+-- state: P pending, A attempted (being processed, or for event pages a failed refresh), D done, Q quarantined.
+CREATE TABLE ozevnts.crawl_frontier
+(
+  vendor_id integer NOT NULL,
+  url text NOT NULL,
+  url_type character(1) NOT NULL,
+  state character(1) NOT NULL,
+  attempts integer NOT NULL DEFAULT 0,
+  last_error text,
+  updated_timestamp timestamp without time zone NOT NULL,
+  CONSTRAINT crawl_frontier_pk PRIMARY KEY (vendor_id, url),
+  CONSTRAINT crawl_frontier_fk1 FOREIGN KEY (vendor_id)
+      REFERENCES ozevnts.vendor (id) MATCH SIMPLE
+      ON UPDATE NO ACTION ON DELETE NO ACTION,
+  CONSTRAINT crawl_frontier_chk1 CHECK (url_type = ANY (ARRAY['S'::bpchar, 'E'::bpchar])),
+  CONSTRAINT crawl_frontier_chk2 CHECK (state = ANY (ARRAY['P'::bpchar, 'A'::bpchar, 'D'::bpchar, 'Q'::bpchar]))
+)
+WITH (
+  OIDS=FALSE
+);
+ALTER TABLE ozevnts.crawl_frontier OWNER TO ozevntsdev;
+GRANT SELECT, INSERT, UPDATE, DELETE ON ozevnts.crawl_frontier TO ozevntsapp;
+
 insert into ozevnts.vendor_listing(vendor_id, event_type_id, search_url, paginated_ind) values (1, 1, 'http://www.moshtix.com.au/v2/search?CategoryList=6%2C&Page=1', 'Y');
 insert into ozevnts.vendor_listing(vendor_id, event_type_id, search_url, paginated_ind) values (1, 1, 'http://www.moshtix.com.au/v2/search?CategoryList=2%2C&Page=1', 'Y');
 insert into ozevnts.vendor_listing(vendor_id, event_type_id, search_url, paginated_ind) values (1, 3, 'http://www.moshtix.com.au/v2/search?CategoryList=3%2C&Page=1', 'Y');
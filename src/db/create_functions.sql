@@ -23,7 +23,34 @@ ALTER FUNCTION ozevnts.array_to_set(anyarray) OWNER TO ozevntsdev;
 GRANT EXECUTE ON FUNCTION ozevnts.array_to_set(anyarray) TO ozevntsapp;
   
 
-CREATE OR REPLACE FUNCTION ozevnts.get_tickets_to_refresh(refcursor)
+-- when an event is next due a refresh: events are refreshed more often the closer
+-- they are, from every 15 minutes up to once a day, scaled by how often previous
+-- refreshes found changes (smoothed, so new events start out unscaled).
+-- stored in vendor_event.next_refresh_timestamp whenever an event is created or
+-- refreshed, so get_tickets_to_refresh can find due events by index.
+CREATE OR REPLACE FUNCTION ozevnts.next_refresh_timestamp(
+    p_last_refreshed_timestamp timestamp without time zone
+   ,p_event_sys_timestamp      timestamp without time zone
+   ,p_refresh_count            integer
+   ,p_change_count             integer
+)
+  RETURNS timestamp without time zone AS
+$BODY$
+    select p_last_refreshed_timestamp + least(interval '1 day', greatest(interval '15 minutes',
+               (p_event_sys_timestamp - p_last_refreshed_timestamp) / 12
+             * (2.0 * (p_refresh_count - p_change_count + 1) / (p_refresh_count + 2))::float8));
+$BODY$
+  LANGUAGE sql IMMUTABLE
+  COST 100;
+ALTER FUNCTION ozevnts.next_refresh_timestamp(timestamp without time zone, timestamp without time zone, integer, integer) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.next_refresh_timestamp(timestamp without time zone, timestamp without time zone, integer, integer) TO ozevntsapp;
+
+
+DROP FUNCTION IF EXISTS ozevnts.get_tickets_to_refresh(refcursor);
+
+-- events (with their tickets) due a refresh within p_horizon, soonest due first, along with
+-- how many refreshes of each have failed lately. events whose page is quarantined are skipped.
+CREATE OR REPLACE FUNCTION ozevnts.get_tickets_to_refresh(refcursor, p_horizon interval)
   RETURNS refcursor AS
 $BODY$
 BEGIN
@@ -37,57 +64,123 @@ BEGIN
           ,vet.ticket_price
           ,vet.booking_fee
           ,vet.sold_out_ind
-    from  ozevnts.vendor_event ve, ozevnts.vendor_event_ticket vet
-    where ve.invalid_ind is null
-      and ve.event_sys_timestamp > current_timestamp 
-      and (
-          (-- event in the next 24 hours? refresh every 120 minutes
-           event_sys_timestamp - current_timestamp <= interval '1 day'
-       and current_timestamp - last_refreshed_timestamp >= interval '120 minutes'
-           ) or
-          (-- event in next 24->48 hours? refresh every 6 hours
-           event_sys_timestamp - current_timestamp > interval '1 day'
-       and event_sys_timestamp - current_timestamp <= interval '2 days'
-       and current_timestamp - last_refreshed_timestamp >= interval '6 hours'
-           ) or
-          (-- event in 48->96 hours? refresh every 12 hours
-           event_sys_timestamp - current_timestamp > interval '2 days'
-       and event_sys_timestamp - current_timestamp <= interval '4 days'
-       and current_timestamp - last_refreshed_timestamp >= interval '12 hours'
-           ) or
-          (-- event in >96 hours? refresh every day
-           event_sys_timestamp - current_timestamp > interval '4 days'
-       and current_timestamp - last_refreshed_timestamp >= interval '1 day'
-           )
-          )
-       and vet.vendor_event_id = ve.id;
+          ,extract(epoch from ve.next_refresh_timestamp - current_timestamp) as due_in_sec
+          ,ve.refresh_failures
+    from (select ve.*
+                ,coalesce(cf.attempts, 0) as refresh_failures
+          from ozevnts.vendor_event ve
+          left join ozevnts.crawl_frontier cf on cf.vendor_id = ve.vendor_id
+                                             and cf.url       = ve.url
+          where ve.invalid_ind is null
+            and ve.next_refresh_timestamp <= current_timestamp + p_horizon
+            and ve.event_sys_timestamp > current_timestamp
+            and (cf.state is null or cf.state <> 'Q')) ve, ozevnts.vendor_event_ticket vet
+    where vet.vendor_event_id = ve.id
+    order by ve.next_refresh_timestamp asc, ve.id asc, vet.ticket_num asc;
                     
     return $1;
 END;
 $BODY$
   LANGUAGE plpgsql VOLATILE
   COST 100;
-ALTER FUNCTION ozevnts.get_tickets_to_refresh(refcursor) OWNER TO ozevntsdev;
-GRANT EXECUTE ON FUNCTION ozevnts.get_tickets_to_refresh(refcursor) TO ozevntsapp;
+ALTER FUNCTION ozevnts.get_tickets_to_refresh(refcursor, interval) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.get_tickets_to_refresh(refcursor, interval) TO ozevntsapp;
 
 
-CREATE OR REPLACE FUNCTION ozevnts.get_known_urls(refcursor, p_vendor_id integer )
+DROP FUNCTION IF EXISTS ozevnts.get_known_urls(refcursor, integer);
+
+-- urls of a vendor's events (archived ones included), only those with ids above
+-- p_min_vendor_event_id so known url indexes can be loaded incrementally
+CREATE OR REPLACE FUNCTION ozevnts.get_known_urls(refcursor, p_vendor_id integer, p_min_vendor_event_id integer)
   RETURNS refcursor AS
 $BODY$
 BEGIN
     open $1 for
     select url
+          ,id
     from ozevnts.vendor_event
-    where vendor_id = p_vendor_id;
+    where vendor_id = p_vendor_id
+      and id > p_min_vendor_event_id
+    union all
+    select url
+          ,id
+    from ozevnts.vendor_event_archive
+    where vendor_id = p_vendor_id
+      and id > p_min_vendor_event_id;
 
     return $1;
 END;
 $BODY$
   LANGUAGE plpgsql VOLATILE
   COST 100;
-ALTER FUNCTION ozevnts.get_known_urls(refcursor, integer)
+ALTER FUNCTION ozevnts.get_known_urls(refcursor, integer, integer)
   OWNER TO ozevntsdev;
-GRANT EXECUTE ON FUNCTION ozevnts.get_known_urls(refcursor, integer) TO ozevntsapp;
+GRANT EXECUTE ON FUNCTION ozevnts.get_known_urls(refcursor, integer, integer) TO ozevntsapp;
+
+
+CREATE OR REPLACE FUNCTION ozevnts.is_known_url(p_url text)
+  RETURNS boolean AS
+$BODY$
+BEGIN
+    return exists (select 1
+                   from ozevnts.vendor_event
+                   where url = p_url)
+        or exists (select 1
+                   from ozevnts.vendor_event_archive
+                   where url = p_url);
+END;
+$BODY$
+  LANGUAGE plpgsql STABLE
+  COST 100;
+ALTER FUNCTION ozevnts.is_known_url(text) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.is_known_url(text) TO ozevntsapp;
+
+
+DROP FUNCTION IF EXISTS ozevnts.archive_past_events(interval);
+
+-- moves events (and their tickets) which finished more than p_age ago, or which never
+-- had a time & haven't been touched for p_age, into the archive tables. their urls
+-- stay known so they aren't crawled again. returns the vendor & url of each event
+-- archived, so their pages can be dropped from the crawlers' http caches.
+CREATE OR REPLACE FUNCTION ozevnts.archive_past_events(p_age interval)
+  RETURNS TABLE(archived_vendor_id integer, archived_url text) AS
+$BODY$
+BEGIN
+    create temporary table archiving_event as
+    select id
+    from ozevnts.vendor_event
+    where event_sys_timestamp < current_timestamp - p_age
+       or (event_sys_timestamp is null and last_refreshed_timestamp < current_timestamp - p_age);
+
+    with archived_ticket as (
+        delete from ozevnts.vendor_event_ticket vet
+        using archiving_event ae
+        where vet.vendor_event_id = ae.id
+        returning vet.*
+    )
+    insert into ozevnts.vendor_event_ticket_archive
+    select * from archived_ticket;
+
+    return query
+    with archived_event as (
+        delete from ozevnts.vendor_event ve
+        using archiving_event ae
+        where ve.id = ae.id
+        returning ve.*
+    ), inserted_event as (
+        insert into ozevnts.vendor_event_archive
+        select * from archived_event
+    )
+    select arc.vendor_id, arc.url
+    from archived_event arc;
+
+    drop table archiving_event;
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  COST 100;
+ALTER FUNCTION ozevnts.archive_past_events(interval) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.archive_past_events(interval) TO ozevntsapp;
   
   
 CREATE OR REPLACE FUNCTION ozevnts.get_search_urls(refcursor, p_vendor_id integer)
@@ -95,7 +188,11 @@ CREATE OR REPLACE FUNCTION ozevnts.get_search_urls(refcursor, p_vendor_id intege
 $BODY$
 BEGIN
     open $1 for
-    select *    
+    select vendor_id
+          ,event_type_id
+          ,search_url
+          ,paginated_ind
+          ,extract(epoch from current_timestamp - last_full_sweep_timestamp) as full_sweep_age_sec
     from ozevnts.vendor_listing
     where vendor_id = p_vendor_id;
 
@@ -108,89 +205,132 @@ ALTER FUNCTION ozevnts.get_search_urls(refcursor, integer) OWNER TO ozevntsdev;
 GRANT EXECUTE ON FUNCTION ozevnts.get_search_urls(refcursor, integer) TO ozevntsapp;
   
   
-CREATE OR REPLACE FUNCTION ozevnts.create_event(
-    p_vendor_id            integer
-   ,p_event_type_id        integer
-   ,p_event_title          text
+-- converts an event's local timestamp to system time using its state's timezone
+CREATE OR REPLACE FUNCTION ozevnts.event_sys_timestamp(
+    p_event_timestamp      timestamp without time zone
    ,p_state                text
-   ,p_event_timestamp      timestamp without time zone
-   ,p_invalid_ind          character
-   ,p_url                  text
 )
-  RETURNS integer AS
+  RETURNS timestamp without time zone AS
+$BODY$
+BEGIN
+    return case when p_event_timestamp is null then null else 
+               p_event_timestamp at time zone 
+               case p_state
+                   when 'ACT' then 'Australia/Canberra'
+                   when 'NSW' then 'Australia/NSW'
+                   when 'QLD' then 'Australia/Queensland'
+                   when 'SA'  then 'Australia/South'
+                   when 'TAS' then 'Australia/Tasmania'
+                   when 'VIC' then 'Australia/Victoria'
+                   when 'WA'  then 'Australia/West'
+               end
+           end;
+END;
+$BODY$
+  LANGUAGE plpgsql STABLE
+  COST 100;
+ALTER FUNCTION ozevnts.event_sys_timestamp(timestamp without time zone, text) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.event_sys_timestamp(timestamp without time zone, text) TO ozevntsapp;
+
+
+-- per event & ticket writes, replaced by create_events & create_tickets
+DROP FUNCTION IF EXISTS ozevnts.create_event(integer, integer, text, text, timestamp without time zone, character, text);
+DROP FUNCTION IF EXISTS ozevnts.create_ticket(integer, integer, text, numeric, numeric, character);
+DROP FUNCTION IF EXISTS ozevnts.update_ticket(integer, integer, text, numeric, numeric, character);
+DROP FUNCTION IF EXISTS ozevnts.invalidate_event(integer);
+
+
+DROP FUNCTION IF EXISTS ozevnts.create_events(integer[], integer[], text[], text[], timestamp without time zone[], text[], text[]);
+
+-- creates a batch of events: each array holds one element per event,
+-- returns the new vendor_event ids in the same order
+CREATE OR REPLACE FUNCTION ozevnts.create_events(
+    p_vendor_ids           integer[]
+   ,p_event_type_ids       integer[]
+   ,p_event_titles         text[]
+   ,p_venues               text[]
+   ,p_states               text[]
+   ,p_event_timestamps     timestamp without time zone[]
+   ,p_invalid_inds         text[]
+   ,p_urls                 text[]
+)
+  RETURNS integer[] AS
 $BODY$
 DECLARE
-    l_id integer;
+    l_ids integer[] := '{}';
+    l_id  integer;
 BEGIN
-    insert into ozevnts.vendor_event(
-        vendor_id
-       ,event_type_id
-       ,event_title
-       ,state
-       ,event_timestamp
-       ,event_sys_timestamp
-       ,last_refreshed_timestamp
-       ,invalid_ind
-       ,url
-     ) values (
-        p_vendor_id
-       ,p_event_type_id
-       ,p_event_title
-       ,p_state
-       ,p_event_timestamp
-       ,case when p_event_timestamp is null then null else 
-            p_event_timestamp at time zone 
-            case p_state
-                when 'ACT' then 'Australia/Canberra'
-                when 'NSW' then 'Australia/NSW'
-                when 'QLD' then 'Australia/Queensland'
-                when 'SA'  then 'Australia/South'
-                when 'TAS' then 'Australia/Tasmania'
-                when 'VIC' then 'Australia/Victoria'
-                when 'WA'  then 'Australia/West'
-            end
-        end
-       ,current_timestamp
-       ,p_invalid_ind
-       ,p_url
-     )
-     returning id
-     into l_id;
-     
-     return l_id;
+    FOR idx IN 1..coalesce(array_upper(p_urls, 1), 0) LOOP
+        insert into ozevnts.vendor_event(
+            vendor_id
+           ,event_type_id
+           ,event_title
+           ,venue
+           ,state
+           ,event_timestamp
+           ,event_sys_timestamp
+           ,last_refreshed_timestamp
+           ,next_refresh_timestamp
+           ,invalid_ind
+           ,url
+         ) values (
+            p_vendor_ids[idx]
+           ,p_event_type_ids[idx]
+           ,p_event_titles[idx]
+           ,p_venues[idx]
+           ,p_states[idx]
+           ,p_event_timestamps[idx]
+           ,ozevnts.event_sys_timestamp(p_event_timestamps[idx], p_states[idx])
+           ,current_timestamp
+           ,ozevnts.next_refresh_timestamp(current_timestamp,
+                                           ozevnts.event_sys_timestamp(p_event_timestamps[idx], p_states[idx]), 0, 0)
+           ,p_invalid_inds[idx]
+           ,p_urls[idx]
+         )
+         returning id
+         into l_id;
+
+         l_ids := l_ids || l_id;
+    END LOOP;
+
+    return l_ids;
 END;
 $BODY$
   LANGUAGE plpgsql VOLATILE
   COST 100;
-ALTER FUNCTION ozevnts.create_event(integer, integer, text, text, timestamp without time zone, character, text) OWNER TO ozevntsdev;
-GRANT EXECUTE ON FUNCTION ozevnts.create_event(integer, integer, text, text, timestamp without time zone, character, text) TO ozevntsapp;
-  
-  
-CREATE OR REPLACE FUNCTION ozevnts.invalidate_event(p_vendor_event_id integer)
-  RETURNS void AS
+ALTER FUNCTION ozevnts.create_events(integer[], integer[], text[], text[], text[], timestamp without time zone[], text[], text[]) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.create_events(integer[], integer[], text[], text[], text[], timestamp without time zone[], text[], text[]) TO ozevntsapp;
+
+
+-- keeps vendor_event.search_vector up to date: title words ranked above venue words
+CREATE OR REPLACE FUNCTION ozevnts.set_event_search_vector()
+  RETURNS trigger AS
 $BODY$
 BEGIN
-    update ozevnts.vendor_event
-    set invalid_ind = 'Y'
-       ,last_refreshed_timestamp = current_timestamp
-    where id = p_vendor_event_id;
-
-    delete from ozevnts.vendor_event_ticket
-    where vendor_event_id = p_vendor_event_id;
+    NEW.search_vector := setweight(to_tsvector('english', coalesce(NEW.event_title, '')), 'A') ||
+                         setweight(to_tsvector('english', coalesce(NEW.venue, '')), 'B');
+    return NEW;
 END;
 $BODY$
   LANGUAGE plpgsql VOLATILE
   COST 100;
-ALTER FUNCTION ozevnts.invalidate_event(integer) OWNER TO ozevntsdev;
-GRANT EXECUTE ON FUNCTION ozevnts.invalidate_event(integer) TO ozevntsapp;
-  
+ALTER FUNCTION ozevnts.set_event_search_vector() OWNER TO ozevntsdev;
 
+DROP TRIGGER IF EXISTS vendor_event_search_vector_trg ON ozevnts.vendor_event;
+CREATE TRIGGER vendor_event_search_vector_trg
+  BEFORE INSERT OR UPDATE OF event_title, venue
+  ON ozevnts.vendor_event
+  FOR EACH ROW EXECUTE PROCEDURE ozevnts.set_event_search_vector();
+  
+  
 CREATE OR REPLACE FUNCTION ozevnts.mark_events_refreshed(p_vendor_event_ids integer[])
   RETURNS void AS
 $BODY$
 BEGIN
     update ozevnts.vendor_event
     set last_refreshed_timestamp = current_timestamp
+       ,next_refresh_timestamp   = ozevnts.next_refresh_timestamp(current_timestamp, event_sys_timestamp,
+                                                                  refresh_count, change_count)
     where id in (select * from ozevnts.array_to_set(p_vendor_event_ids));
 END;
 $BODY$
@@ -200,13 +340,14 @@ ALTER FUNCTION ozevnts.mark_events_refreshed(integer[]) OWNER TO ozevntsdev;
 GRANT EXECUTE ON FUNCTION ozevnts.mark_events_refreshed(integer[]) TO ozevntsapp;
  
  
-CREATE OR REPLACE FUNCTION ozevnts.create_ticket(
-    p_vendor_event_id      integer
-   ,p_ticket_num           integer
-   ,p_ticket_type          text
-   ,p_ticket_price         numeric
-   ,p_booking_fee          numeric
-   ,p_sold_out_ind         character
+-- creates a batch of tickets: each array holds one element per ticket
+CREATE OR REPLACE FUNCTION ozevnts.create_tickets(
+    p_vendor_event_ids     integer[]
+   ,p_ticket_nums          integer[]
+   ,p_ticket_types         text[]
+   ,p_ticket_prices        numeric[]
+   ,p_booking_fees         numeric[]
+   ,p_sold_out_inds        text[]
 )
   RETURNS void AS
 $BODY$
@@ -218,50 +359,174 @@ BEGIN
        ,ticket_price
        ,booking_fee
        ,sold_out_ind
-    ) values (
-        p_vendor_event_id
-       ,p_ticket_num
-       ,p_ticket_type
-       ,p_ticket_price
-       ,p_booking_fee
-       ,p_sold_out_ind
-    );
+    )
+    select p_vendor_event_ids[idx]
+          ,p_ticket_nums[idx]
+          ,p_ticket_types[idx]
+          ,p_ticket_prices[idx]
+          ,p_booking_fees[idx]
+          ,p_sold_out_inds[idx]
+    from generate_subscripts(p_vendor_event_ids, 1) idx;
 END;
 $BODY$
   LANGUAGE plpgsql VOLATILE
   COST 100;
-ALTER FUNCTION ozevnts.create_ticket(integer, integer, text, numeric, numeric, character) OWNER TO ozevntsdev;
-GRANT EXECUTE ON FUNCTION ozevnts.create_ticket(integer, integer, text, numeric, numeric, character) TO ozevntsapp;
+ALTER FUNCTION ozevnts.create_tickets(integer[], integer[], text[], numeric[], numeric[], text[]) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.create_tickets(integer[], integer[], text[], numeric[], numeric[], text[]) TO ozevntsapp;
 
   
-CREATE OR REPLACE FUNCTION ozevnts.update_ticket(
-    p_vendor_event_id      integer
-   ,p_ticket_num           integer
-   ,p_ticket_type          text
-   ,p_ticket_price         numeric
-   ,p_booking_fee          numeric
-   ,p_sold_out_ind         character
+-- applies the refreshed tickets of a batch of events and marks them refreshed,
+-- counting the refresh and whether it changed any of the event's tickets.
+-- p_vendor_event_ids & p_match_inds hold one element per event, p_match_inds being:
+--   'N': tickets matched on ticket_num, changed ones are updated & new ones created
+--   'T': unsold tickets matched on ticket_type, changed ones are updated & ones
+--        no longer listed are marked sold out
+--   null: tickets left as they are, event only marked refreshed
+-- the remaining arrays hold one element per refreshed ticket.
+DROP FUNCTION IF EXISTS ozevnts.apply_refreshed_tickets(integer[], text[], integer[], integer[], text[], numeric[], numeric[], text[]);
+
+CREATE OR REPLACE FUNCTION ozevnts.apply_refreshed_tickets(
+    p_vendor_event_ids     integer[]
+   ,p_match_inds           text[]
+   ,p_ticket_event_ids     integer[]
+   ,p_ticket_nums          integer[]
+   ,p_ticket_types         text[]
+   ,p_ticket_prices        numeric[]
+   ,p_booking_fees         numeric[]
+   ,p_sold_out_inds        text[]
 )
-  RETURNS void AS
+  RETURNS integer AS
 $BODY$
+DECLARE
+    l_num_changed_tickets integer;
 BEGIN
-    update ozevnts.vendor_event_ticket
-     set ticket_type  = p_ticket_type
-        ,ticket_price = p_ticket_price
-        ,booking_fee  = p_booking_fee
-        ,sold_out_ind = p_sold_out_ind
-      where vendor_event_id = p_vendor_event_id
-        and ticket_num      = p_ticket_num;
+    with refreshed_event as (
+        select p_vendor_event_ids[idx] as vendor_event_id
+              ,p_match_inds[idx]       as match_ind
+        from generate_subscripts(p_vendor_event_ids, 1) idx
+    ), refreshed_ticket as (
+        select re.match_ind
+              ,p_ticket_event_ids[idx]            as vendor_event_id
+              ,p_ticket_nums[idx]                 as ticket_num
+              ,p_ticket_types[idx]                as ticket_type
+              ,p_ticket_prices[idx]               as ticket_price
+              ,p_booking_fees[idx]                as booking_fee
+              ,p_sold_out_inds[idx]::character(1) as sold_out_ind
+        from generate_subscripts(p_ticket_event_ids, 1) idx, refreshed_event re
+        where re.vendor_event_id = p_ticket_event_ids[idx]
+    ), updated_by_num as (
+        update ozevnts.vendor_event_ticket vet
+        set ticket_type  = rt.ticket_type
+           ,ticket_price = rt.ticket_price
+           ,booking_fee  = rt.booking_fee
+           ,sold_out_ind = rt.sold_out_ind
+        from refreshed_ticket rt
+        where rt.match_ind        = 'N'
+          and vet.vendor_event_id = rt.vendor_event_id
+          and vet.ticket_num      = rt.ticket_num
+          and (vet.ticket_type, vet.ticket_price, vet.booking_fee, vet.sold_out_ind) is distinct from
+              (rt.ticket_type,  rt.ticket_price,  rt.booking_fee,  rt.sold_out_ind)
+        returning vet.vendor_event_id
+    ), created as (
+        insert into ozevnts.vendor_event_ticket(
+            vendor_event_id
+           ,ticket_num
+           ,ticket_type
+           ,ticket_price
+           ,booking_fee
+           ,sold_out_ind
+        )
+        select rt.vendor_event_id
+              ,rt.ticket_num
+              ,rt.ticket_type
+              ,rt.ticket_price
+              ,rt.booking_fee
+              ,rt.sold_out_ind
+        from refreshed_ticket rt
+        where rt.match_ind = 'N'
+          and not exists (select 1
+                          from ozevnts.vendor_event_ticket vet
+                          where vet.vendor_event_id = rt.vendor_event_id
+                            and vet.ticket_num      = rt.ticket_num)
+        returning vendor_event_id
+    ), updated_by_type as (
+        update ozevnts.vendor_event_ticket vet
+        set ticket_price = rt.ticket_price
+           ,booking_fee  = rt.booking_fee
+           ,sold_out_ind = rt.sold_out_ind
+        from (-- first listed ticket of each type
+              select distinct on (vendor_event_id, ticket_type) *
+              from refreshed_ticket
+              where match_ind = 'T'
+              order by vendor_event_id, ticket_type, ticket_num) rt
+        where vet.vendor_event_id = rt.vendor_event_id
+          and vet.ticket_type     = rt.ticket_type
+          and vet.sold_out_ind is null
+          and (vet.ticket_price, vet.booking_fee, vet.sold_out_ind) is distinct from
+              (rt.ticket_price,  rt.booking_fee,  rt.sold_out_ind)
+        returning vet.vendor_event_id
+    ), sold_out as (
+        update ozevnts.vendor_event_ticket vet
+        set sold_out_ind = 'Y'
+        from refreshed_event re
+        where re.match_ind        = 'T'
+          and vet.vendor_event_id = re.vendor_event_id
+          and vet.sold_out_ind is null
+          and not exists (select 1
+                          from refreshed_ticket rt
+                          where rt.vendor_event_id = vet.vendor_event_id
+                            and rt.ticket_type     = vet.ticket_type)
+        returning vet.vendor_event_id
+    ), changed_ticket as (
+        select vendor_event_id from updated_by_num
+        union all
+        select vendor_event_id from created
+        union all
+        select vendor_event_id from updated_by_type
+        union all
+        select vendor_event_id from sold_out
+    ), refresh_counts as (
+        select re.vendor_event_id
+              ,ve.refresh_count + 1 as refresh_count
+              ,ve.change_count + case when re.vendor_event_id in (select vendor_event_id from changed_ticket)
+                                      then 1 else 0 end as change_count
+        from refreshed_event re, ozevnts.vendor_event ve
+        where ve.id = re.vendor_event_id
+    ), marked_refreshed as (
+        update ozevnts.vendor_event ve
+        set last_refreshed_timestamp = current_timestamp
+           ,refresh_count            = rc.refresh_count
+           ,change_count             = rc.change_count
+           ,next_refresh_timestamp   = ozevnts.next_refresh_timestamp(current_timestamp, ve.event_sys_timestamp,
+                                                                      rc.refresh_count, rc.change_count)
+        from refresh_counts rc
+        where ve.id = rc.vendor_event_id
+        returning ve.id
+    )
+    select count(*)
+    into l_num_changed_tickets
+    from changed_ticket;
+
+    RETURN l_num_changed_tickets;
 END;
 $BODY$
   LANGUAGE plpgsql VOLATILE
   COST 100;
-ALTER FUNCTION ozevnts.update_ticket(integer, integer, text, numeric, numeric, character) OWNER TO ozevntsdev;
-GRANT EXECUTE ON FUNCTION ozevnts.update_ticket(integer, integer, text, numeric, numeric, character) TO ozevntsapp;
+ALTER FUNCTION ozevnts.apply_refreshed_tickets(integer[], text[], integer[], integer[], text[], numeric[], numeric[], text[]) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.apply_refreshed_tickets(integer[], text[], integer[], integer[], text[], numeric[], numeric[], text[]) TO ozevntsapp;
   
   
--- default homepage view: events in next 7 days  
-CREATE OR REPLACE FUNCTION ozevnts.get_soon_events(refcursor)
+DROP FUNCTION IF EXISTS ozevnts.get_soon_events(refcursor);
+
+-- default homepage view: events in next 7 days, a page at a time. a page holds up
+-- to p_max_events events following the (event_timestamp, id) of the last event of
+-- the previous page, p_after_* being null for the first page.
+CREATE OR REPLACE FUNCTION ozevnts.get_soon_events(
+    refcursor
+   ,p_after_timestamp      timestamp without time zone
+   ,p_after_id             integer
+   ,p_max_events           integer
+)
   RETURNS refcursor AS
 $BODY$
 BEGIN
@@ -276,11 +541,16 @@ BEGIN
           ,v.title
           ,ve.url
           ,ve.id
-    from ozevnts.vendor_event ve, ozevnts.vendor v, ozevnts.vendor_event_ticket vet
-    where ve.event_sys_timestamp > current_timestamp 
-      and ve.event_sys_timestamp - current_timestamp <= interval '7 days'
-      and ve.invalid_ind is null
-      and ve.vendor_id = v.id
+    from (select ve.*
+          from ozevnts.vendor_event ve
+          where ve.event_sys_timestamp > current_timestamp 
+            and ve.event_sys_timestamp <= current_timestamp + interval '7 days'
+            and ve.invalid_ind is null
+            and (p_after_id is null or (ve.event_timestamp, ve.id) > (p_after_timestamp, p_after_id))
+            and exists (select 1 from ozevnts.vendor_event_ticket vet where vet.vendor_event_id = ve.id)
+          order by ve.event_timestamp asc, ve.id asc
+          limit p_max_events) ve, ozevnts.vendor v, ozevnts.vendor_event_ticket vet
+    where ve.vendor_id = v.id
       and vet.vendor_event_id = ve.id
     order by ve.event_timestamp asc, ve.id asc, vet.ticket_num asc;
 
@@ -289,13 +559,32 @@ END;
 $BODY$
   LANGUAGE plpgsql VOLATILE
   COST 100;
-ALTER FUNCTION ozevnts.get_soon_events(refcursor) OWNER TO ozevntsdev;
-GRANT EXECUTE ON FUNCTION ozevnts.get_soon_events(refcursor) TO ozevntsapp;
+ALTER FUNCTION ozevnts.get_soon_events(refcursor, timestamp without time zone, integer, integer) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.get_soon_events(refcursor, timestamp without time zone, integer, integer) TO ozevntsapp;
 
-  
-CREATE OR REPLACE FUNCTION ozevnts.find_events(refcursor, p_query text, p_state text, p_event_type_id integer)
+
+DROP FUNCTION IF EXISTS ozevnts.find_events(refcursor, text, text, integer);
+
+-- events matching a search, most relevant first. events match on title/venue words
+-- (stemmed), or on a title/venue substring or similar (typo tolerant) title, all
+-- index backed. an empty query matches everything, listed soonest first.
+-- paged like get_soon_events, keyed by the (rank, event_timestamp, id) of the last
+-- event of the previous page. ranks are rounded so they can be passed back exactly.
+CREATE OR REPLACE FUNCTION ozevnts.find_events(
+    refcursor
+   ,p_query                text
+   ,p_state                text
+   ,p_event_type_id        integer
+   ,p_after_rank           numeric
+   ,p_after_timestamp      timestamp without time zone
+   ,p_after_id             integer
+   ,p_max_events           integer
+)
   RETURNS refcursor AS
 $BODY$
+DECLARE
+    l_query    text    := trim(coalesce(p_query, ''));
+    l_ts_query tsquery := plainto_tsquery('english', l_query);
 BEGIN
     open $1 for
     select ve.event_timestamp
@@ -308,20 +597,226 @@ BEGIN
           ,v.title
           ,ve.url
           ,ve.id
-    from ozevnts.vendor_event ve, ozevnts.vendor v, ozevnts.vendor_event_ticket vet
-    where ve.event_sys_timestamp > current_timestamp
-      and ve.invalid_ind is null
-      and ve.event_title ilike '%' || p_query || '%'
-      and case when p_state = 'All' then ve.state = ve.state else ve.state = p_state end
-      and case when p_event_type_id = 0 then ve.event_type_id = ve.event_type_id else ve.event_type_id = p_event_type_id end
-      and ve.vendor_id = v.id
+          ,ve.rank
+    from (select ve.*
+          from (select ve.*
+                      ,case when l_query = '' then 0
+                            else round((ts_rank_cd(ve.search_vector, l_ts_query) +
+                                        similarity(ve.event_title, l_query))::numeric, 6)
+                       end as rank
+                from ozevnts.vendor_event ve
+                where ve.event_sys_timestamp > current_timestamp
+                  and ve.invalid_ind is null
+                  and (l_query = ''
+                       or ve.search_vector @@ l_ts_query
+                       or ve.event_title ilike '%' || l_query || '%'
+                       or ve.venue ilike '%' || l_query || '%'
+                       or ve.event_title % l_query)
+                  and case when p_state = 'All' then ve.state = ve.state else ve.state = p_state end
+                  and case when p_event_type_id = 0 then ve.event_type_id = ve.event_type_id else ve.event_type_id = p_event_type_id end
+                  and exists (select 1 from ozevnts.vendor_event_ticket vet where vet.vendor_event_id = ve.id)
+               ) ve
+          where p_after_id is null
+             or ve.rank < p_after_rank
+             or (ve.rank = p_after_rank and (ve.event_timestamp, ve.id) > (p_after_timestamp, p_after_id))
+          order by ve.rank desc, ve.event_timestamp asc, ve.id asc
+          limit p_max_events) ve, ozevnts.vendor v, ozevnts.vendor_event_ticket vet
+    where ve.vendor_id = v.id
       and vet.vendor_event_id = ve.id
-    order by ve.event_timestamp asc, ve.id asc, vet.ticket_num asc;   
+    order by ve.rank desc, ve.event_timestamp asc, ve.id asc, vet.ticket_num asc;
+
+    return $1;
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  COST 100;
+ALTER FUNCTION ozevnts.find_events(refcursor, text, text, integer, numeric, timestamp without time zone, integer, integer) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.find_events(refcursor, text, text, integer, numeric, timestamp without time zone, integer, integer) TO ozevntsapp;
+
+
+-- bumps the data version, once per transaction. fired by deferred constraint triggers,
+-- so only once the changing transaction is about to commit, which keeps the version row
+-- locked as briefly as possible. the new version is committed along with the changes,
+-- so it's never seen before them. later firings in the same transaction find it
+-- already bumped & leave it be.
+CREATE OR REPLACE FUNCTION ozevnts.bump_data_version()
+  RETURNS trigger AS
+$BODY$
+BEGIN
+    update ozevnts.data_version
+    set version     = version + 1
+       ,bumped_txid = txid_current()
+    where bumped_txid is distinct from txid_current();
+
+    return null;
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  COST 100;
+ALTER FUNCTION ozevnts.bump_data_version() OWNER TO ozevntsdev;
+
+-- only columns shown to users, so marking events refreshed doesn't count as a change
+DROP TRIGGER IF EXISTS vendor_event_data_version_trg ON ozevnts.vendor_event;
+CREATE CONSTRAINT TRIGGER vendor_event_data_version_trg
+  AFTER INSERT OR DELETE OR UPDATE OF event_type_id, event_title, state, event_timestamp, event_sys_timestamp,
+                                      invalid_ind, url
+  ON ozevnts.vendor_event
+  DEFERRABLE INITIALLY DEFERRED
+  FOR EACH ROW EXECUTE PROCEDURE ozevnts.bump_data_version();
+
+DROP TRIGGER IF EXISTS vendor_event_ticket_data_version_trg ON ozevnts.vendor_event_ticket;
+CREATE CONSTRAINT TRIGGER vendor_event_ticket_data_version_trg
+  AFTER INSERT OR UPDATE OR DELETE
+  ON ozevnts.vendor_event_ticket
+  DEFERRABLE INITIALLY DEFERRED
+  FOR EACH ROW EXECUTE PROCEDURE ozevnts.bump_data_version();
+
+
+-- current data version, cached pages rendered at an older version are stale
+CREATE OR REPLACE FUNCTION ozevnts.get_data_version()
+  RETURNS bigint AS
+$BODY$
+BEGIN
+    return (select version from ozevnts.data_version);
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  COST 100;
+ALTER FUNCTION ozevnts.get_data_version() OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.get_data_version() TO ozevntsapp;
+
+CREATE OR REPLACE FUNCTION ozevnts.start_crawl_cycle(p_vendor_id integer)
+  RETURNS boolean AS
+$BODY$
+DECLARE
+    l_resuming boolean;
+BEGIN
+    -- search pages are only left in the frontier by a cycle which didn't finish
+    l_resuming := exists (select 1
+                          from ozevnts.crawl_frontier
+                          where vendor_id = p_vendor_id
+                            and url_type  = 'S');
+
+    if not l_resuming then
+        insert into ozevnts.crawl_frontier(
+            vendor_id
+           ,url
+           ,url_type
+           ,state
+           ,updated_timestamp
+        )
+        select distinct vendor_id
+              ,search_url
+              ,'S'
+              ,'P'
+              ,current_timestamp
+        from ozevnts.vendor_listing
+        where vendor_id = p_vendor_id;
+    end if;
+
+    return l_resuming;
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  COST 100;
+ALTER FUNCTION ozevnts.start_crawl_cycle(integer) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.start_crawl_cycle(integer) TO ozevntsapp;
+
+CREATE OR REPLACE FUNCTION ozevnts.get_crawl_frontier(refcursor, p_vendor_id integer)
+  RETURNS refcursor AS
+$BODY$
+BEGIN
+    open $1 for
+    select url
+          ,url_type
+          ,state
+          ,attempts
+    from ozevnts.crawl_frontier
+    where vendor_id = p_vendor_id;
 
     return $1;
 END;
 $BODY$
   LANGUAGE plpgsql VOLATILE
   COST 100;
-ALTER FUNCTION ozevnts.find_events(refcursor, text, text, integer) OWNER TO ozevntsdev;
-GRANT EXECUTE ON FUNCTION ozevnts.find_events(refcursor, text, text, integer) TO ozevntsapp;
+ALTER FUNCTION ozevnts.get_crawl_frontier(refcursor, integer) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.get_crawl_frontier(refcursor, integer) TO ozevntsapp;
+
+CREATE OR REPLACE FUNCTION ozevnts.set_crawl_url_state(p_vendor_id integer, p_url text, p_url_type text, p_state text,
+                                                       p_last_error text)
+  RETURNS void AS
+$BODY$
+BEGIN
+    -- setting a url attempted counts an attempt at it
+    update ozevnts.crawl_frontier
+    set state             = p_state
+       ,attempts          = attempts + case when p_state = 'A' then 1 else 0 end
+       ,last_error        = coalesce(p_last_error, last_error)
+       ,updated_timestamp = current_timestamp
+    where vendor_id = p_vendor_id
+      and url       = p_url;
+
+    if not found then
+        insert into ozevnts.crawl_frontier(
+            vendor_id
+           ,url
+           ,url_type
+           ,state
+           ,attempts
+           ,last_error
+           ,updated_timestamp
+        )
+        values (
+            p_vendor_id
+           ,p_url
+           ,p_url_type
+           ,p_state
+           ,case when p_state = 'A' then 1 else 0 end
+           ,p_last_error
+           ,current_timestamp
+        );
+    end if;
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  COST 100;
+ALTER FUNCTION ozevnts.set_crawl_url_state(integer, text, text, text, text) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.set_crawl_url_state(integer, text, text, text, text) TO ozevntsapp;
+
+CREATE OR REPLACE FUNCTION ozevnts.finish_crawl_cycle(p_vendor_id integer, p_quarantine_period interval)
+  RETURNS void AS
+$BODY$
+BEGIN
+    -- the next cycle starts afresh, bar event pages still in quarantine
+    delete from ozevnts.crawl_frontier
+    where vendor_id = p_vendor_id
+      and (url_type = 'S'
+           or updated_timestamp < current_timestamp - p_quarantine_period);
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  COST 100;
+ALTER FUNCTION ozevnts.finish_crawl_cycle(integer, interval) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.finish_crawl_cycle(integer, interval) TO ozevntsapp;
+
+CREATE OR REPLACE FUNCTION ozevnts.save_listing_stats(p_vendor_id integer, p_event_type_id integer, p_search_url text,
+                                                      p_num_pages integer, p_num_new_events integer,
+                                                      p_full_sweep boolean)
+  RETURNS void AS
+$BODY$
+BEGIN
+    update ozevnts.vendor_listing
+    set last_num_pages            = p_num_pages
+       ,last_num_new_events       = p_num_new_events
+       ,last_crawled_timestamp    = current_timestamp
+       ,last_full_sweep_timestamp = case when p_full_sweep then current_timestamp
+                                         else last_full_sweep_timestamp end
+    where vendor_id     = p_vendor_id
+      and event_type_id = p_event_type_id
+      and search_url    = p_search_url;
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  COST 100;
+ALTER FUNCTION ozevnts.save_listing_stats(integer, integer, text, integer, integer, boolean) OWNER TO ozevntsdev;
+GRANT EXECUTE ON FUNCTION ozevnts.save_listing_stats(integer, integer, text, integer, integer, boolean) TO ozevntsapp;
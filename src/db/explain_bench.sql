@@ -0,0 +1,115 @@
+-- query plans & timings of the hot queries behind the stored function API,
+-- to check they use the current event indexes rather than scanning past events.
+-- run with psql as ozevntsdev, eg. before & after upgrade_ddl.sql or
+-- archive_past_events, and compare the plans, buffers & execution times:
+--
+--   psql -d ozevntsdb -f explain_bench.sql > explain_before.txt
+
+\timing on
+
+-- get_soon_events, first page (page_size + 1 events)
+EXPLAIN (ANALYZE, BUFFERS)
+select ve.event_timestamp
+      ,ve.event_title
+      ,ve.state
+      ,vet.ticket_type
+      ,vet.ticket_price
+      ,vet.booking_fee
+      ,vet.sold_out_ind
+      ,v.title
+      ,ve.url
+      ,ve.id
+from (select ve.*
+      from ozevnts.vendor_event ve
+      where ve.event_sys_timestamp > current_timestamp
+        and ve.event_sys_timestamp <= current_timestamp + interval '7 days'
+        and ve.invalid_ind is null
+        and exists (select 1 from ozevnts.vendor_event_ticket vet where vet.vendor_event_id = ve.id)
+      order by ve.event_timestamp asc, ve.id asc
+      limit 51) ve, ozevnts.vendor v, ozevnts.vendor_event_ticket vet
+where ve.vendor_id = v.id
+  and vet.vendor_event_id = ve.id
+order by ve.event_timestamp asc, ve.id asc, vet.ticket_num asc;
+
+-- get_soon_events, a later page, keyset after an event 3 days out
+EXPLAIN (ANALYZE, BUFFERS)
+select ve.event_timestamp
+      ,ve.event_title
+      ,ve.state
+      ,vet.ticket_type
+      ,vet.ticket_price
+      ,vet.booking_fee
+      ,vet.sold_out_ind
+      ,v.title
+      ,ve.url
+      ,ve.id
+from (select ve.*
+      from ozevnts.vendor_event ve
+      where ve.event_sys_timestamp > current_timestamp
+        and ve.event_sys_timestamp <= current_timestamp + interval '7 days'
+        and ve.invalid_ind is null
+        and (ve.event_timestamp, ve.id) > (localtimestamp + interval '3 days', 0)
+        and exists (select 1 from ozevnts.vendor_event_ticket vet where vet.vendor_event_id = ve.id)
+      order by ve.event_timestamp asc, ve.id asc
+      limit 51) ve, ozevnts.vendor v, ozevnts.vendor_event_ticket vet
+where ve.vendor_id = v.id
+  and vet.vendor_event_id = ve.id
+order by ve.event_timestamp asc, ve.id asc, vet.ticket_num asc;
+
+-- find_events, category filter without a query
+EXPLAIN (ANALYZE, BUFFERS)
+select ve.id
+from ozevnts.vendor_event ve
+where ve.event_sys_timestamp > current_timestamp
+  and ve.invalid_ind is null
+  and ve.event_type_id = 1;
+
+-- find_events, query matching
+EXPLAIN (ANALYZE, BUFFERS)
+select ve.id
+from ozevnts.vendor_event ve
+where ve.event_sys_timestamp > current_timestamp
+  and ve.invalid_ind is null
+  and (ve.search_vector @@ plainto_tsquery('english', 'festival')
+       or ve.event_title ilike '%festival%'
+       or ve.venue ilike '%festival%'
+       or ve.event_title % 'festival');
+
+-- get_tickets_to_refresh, due events should come from vendor_event_next_refresh_idx
+EXPLAIN (ANALYZE, BUFFERS)
+select ve.id
+      ,vet.ticket_num
+      ,ve.refresh_failures
+from (select ve.*
+            ,coalesce(cf.attempts, 0) as refresh_failures
+      from ozevnts.vendor_event ve
+      left join ozevnts.crawl_frontier cf on cf.vendor_id = ve.vendor_id
+                                         and cf.url       = ve.url
+      where ve.invalid_ind is null
+        and ve.next_refresh_timestamp <= current_timestamp + interval '5 minutes'
+        and ve.event_sys_timestamp > current_timestamp
+        and (cf.state is null or cf.state <> 'Q')) ve, ozevnts.vendor_event_ticket vet
+where vet.vendor_event_id = ve.id
+order by ve.next_refresh_timestamp asc, ve.id asc, vet.ticket_num asc;
+
+-- get_known_urls, incremental load
+EXPLAIN (ANALYZE, BUFFERS)
+select url, id from ozevnts.vendor_event where vendor_id = 1 and id > 0
+union all
+select url, id from ozevnts.vendor_event_archive where vendor_id = 1 and id > 0;
+
+-- apply_refreshed_tickets, unsold tickets of an event by type
+EXPLAIN (ANALYZE, BUFFERS)
+select vet.ticket_num
+from ozevnts.vendor_event_ticket vet
+where vet.vendor_event_id = (select max(id) from ozevnts.vendor_event)
+  and vet.ticket_type = 'General Admission'
+  and vet.sold_out_ind is null;
+
+-- table sizes: live tables should only hold current events once archived
+select relname
+      ,n_live_tup
+      ,pg_size_pretty(pg_total_relation_size(relid)) as total_size
+from pg_stat_user_tables
+where schemaname = 'ozevnts'
+order by relname;
@@ -18,5 +18,8 @@ CREATE SCHEMA ozevnts AUTHORIZATION ozevntsdev;
 GRANT ALL ON SCHEMA ozevnts TO ozevntsdev;
 GRANT USAGE ON SCHEMA ozevnts TO ozevntsapp;
 
+-- trigram matching, used by event search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- now connect as ozevntsdev and run the create_ddl.sql and create_functions.sql scripts
 
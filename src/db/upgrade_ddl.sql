@@ -0,0 +1,105 @@
+-- brings the schema of an existing database up to date with create_ddl.sql.
+-- each section only needs running once, in order, after which
+-- create_functions.sql should be re-run.
+--
+-- This script should be run as ozevntsdev.
+
+-- refresh scheduling: counts of refreshes & refreshes which found ticket changes
+ALTER TABLE ozevnts.vendor_event ADD COLUMN refresh_count integer NOT NULL DEFAULT 0;
+ALTER TABLE ozevnts.vendor_event ADD COLUMN change_count integer NOT NULL DEFAULT 0;
+
+-- cached page invalidation: version bumped whenever event data changes
+CREATE SEQUENCE ozevnts.data_version_seq;
+ALTER SEQUENCE ozevnts.data_version_seq OWNER TO ozevntsdev;
+GRANT SELECT, USAGE ON ozevnts.data_version_seq TO ozevntsapp;
+
+-- event search: venue & full text search columns, search indexes.
+-- needs the pg_trgm extension created first, see superuser.sql
+ALTER TABLE ozevnts.vendor_event ADD COLUMN venue text;
+ALTER TABLE ozevnts.vendor_event ADD COLUMN search_vector tsvector;
+UPDATE ozevnts.vendor_event
+SET search_vector = setweight(to_tsvector('english', coalesce(event_title, '')), 'A');
+CREATE INDEX vendor_event_search_idx ON ozevnts.vendor_event USING gin (search_vector);
+CREATE INDEX vendor_event_title_trgm_idx ON ozevnts.vendor_event USING gin (event_title gin_trgm_ops);
+CREATE INDEX vendor_event_venue_trgm_idx ON ozevnts.vendor_event USING gin (venue gin_trgm_ops);
+
+-- current event indexes & past event archive tables
+CREATE INDEX vendor_event_valid_ts_idx ON ozevnts.vendor_event (event_sys_timestamp) WHERE invalid_ind IS NULL;
+CREATE INDEX vendor_event_valid_type_ts_idx ON ozevnts.vendor_event (event_type_id, event_sys_timestamp) WHERE invalid_ind IS NULL;
+CREATE INDEX vendor_event_vendor_id_idx ON ozevnts.vendor_event (vendor_id, id);
+CREATE INDEX vendor_event_ticket_unsold_type_idx ON ozevnts.vendor_event_ticket (vendor_event_id, ticket_type)
+  WHERE sold_out_ind IS NULL;
+
+CREATE TABLE ozevnts.vendor_event_archive
+(
+  LIKE ozevnts.vendor_event INCLUDING DEFAULTS,
+  CONSTRAINT vendor_event_archive_pk PRIMARY KEY (id)
+);
+ALTER TABLE ozevnts.vendor_event_archive OWNER TO ozevntsdev;
+GRANT SELECT, INSERT, UPDATE, DELETE ON ozevnts.vendor_event_archive TO ozevntsapp;
+CREATE INDEX vendor_event_archive_url_idx ON ozevnts.vendor_event_archive (url);
+CREATE INDEX vendor_event_archive_vendor_id_idx ON ozevnts.vendor_event_archive (vendor_id, id);
+
+CREATE TABLE ozevnts.vendor_event_ticket_archive
+(
+  LIKE ozevnts.vendor_event_ticket INCLUDING DEFAULTS,
+  CONSTRAINT vendor_event_ticket_archive_pk PRIMARY KEY (vendor_event_id, ticket_num)
+);
+ALTER TABLE ozevnts.vendor_event_ticket_archive OWNER TO ozevntsdev;
+GRANT SELECT, INSERT, UPDATE, DELETE ON ozevnts.vendor_event_ticket_archive TO ozevntsapp;
+
+-- then run create_functions.sql & archive existing past events with:
+-- select ozevnts.archive_past_events('1 day');
+
+-- crawl frontier, for resuming crashed crawl cycles
+CREATE TABLE ozevnts.crawl_frontier
+(
+  vendor_id integer NOT NULL,
+  url text NOT NULL,
+  url_type character(1) NOT NULL,
+  state character(1) NOT NULL,
+  attempts integer NOT NULL DEFAULT 0,
+  last_error text,
+  updated_timestamp timestamp without time zone NOT NULL,
+  CONSTRAINT crawl_frontier_pk PRIMARY KEY (vendor_id, url),
+  CONSTRAINT crawl_frontier_fk1 FOREIGN KEY (vendor_id)
+      REFERENCES ozevnts.vendor (id) MATCH SIMPLE
+      ON UPDATE NO ACTION ON DELETE NO ACTION,
+  CONSTRAINT crawl_frontier_chk1 CHECK (url_type = ANY (ARRAY['S'::bpchar, 'E'::bpchar])),
+  CONSTRAINT crawl_frontier_chk2 CHECK (state = ANY (ARRAY['P'::bpchar, 'A'::bpchar, 'D'::bpchar, 'Q'::bpchar]))
+)
+WITH (
+  OIDS=FALSE
+);
+ALTER TABLE ozevnts.crawl_frontier OWNER TO ozevntsdev;
+GRANT SELECT, INSERT, UPDATE, DELETE ON ozevnts.crawl_frontier TO ozevntsapp;
+
+-- per listing crawl stats, for incremental crawls of paginated listings
+ALTER TABLE ozevnts.vendor_listing ADD COLUMN last_num_pages integer;
+ALTER TABLE ozevnts.vendor_listing ADD COLUMN last_num_new_events integer;
+ALTER TABLE ozevnts.vendor_listing ADD COLUMN last_crawled_timestamp timestamp without time zone;
+ALTER TABLE ozevnts.vendor_listing ADD COLUMN last_full_sweep_timestamp timestamp without time zone;
+
+-- refresh scheduling: when each event is next due a refresh, kept by the functions
+-- which create & refresh events so the refresher can find due events by index
+ALTER TABLE ozevnts.vendor_event ADD COLUMN next_refresh_timestamp timestamp without time zone;
+ALTER TABLE ozevnts.vendor_event_archive ADD COLUMN next_refresh_timestamp timestamp without time zone;
+CREATE INDEX vendor_event_next_refresh_idx ON ozevnts.vendor_event (next_refresh_timestamp) WHERE invalid_ind IS NULL;
+
+-- then run create_functions.sql & fill it in for existing events with:
+-- update ozevnts.vendor_event
+-- set next_refresh_timestamp = ozevnts.next_refresh_timestamp(last_refreshed_timestamp, event_sys_timestamp,
+--                                                             refresh_count, change_count);
+
+-- cached page invalidation: version kept in a table, so it's bumped in (and committed
+-- with) the changing transaction
+CREATE TABLE ozevnts.data_version
+(
+  version bigint NOT NULL,
+  bumped_txid bigint
+);
+ALTER TABLE ozevnts.data_version OWNER TO ozevntsdev;
+GRANT SELECT, UPDATE ON ozevnts.data_version TO ozevntsapp;
+-- carries on from the sequence, as web servers never let their version go backwards
+insert into ozevnts.data_version(version) select last_value from ozevnts.data_version_seq;
+DROP SEQUENCE ozevnts.data_version_seq;
@@ -1,15 +1,27 @@
 import re
 import logging
 import os
+import time
+import gzip
+import json
+import datetime
+import decimal
+import StringIO
 
-from flask import Flask, render_template, request
-import psycopg2
+from flask import Flask, Response, abort, request, stream_with_context, url_for
 from libcrawler import libcrawler
-from util import dbconnector
+from util import dbconnector, dbpool, metrics, pagecache
 
 
-def load_events(db_con, stored_proc_name, args):
-    event_list    = []
+# have psycopg2 return text as unicode on pooled connections, rather than decoding each row here
+unicode_results = True
+
+
+def iter_events(db_con, stored_proc_name, args):
+    """ 
+        Yields each event (with its tickets) as soon as all of its rows have been read
+        from the stored proc's server side cursor, so only one event is held at once.
+    """
     current_event = None
 
     with db_con.cursor() as cur1:
@@ -17,37 +29,131 @@ def load_events(db_con, stored_proc_name, args):
 
         with db_con.cursor(args[0]) as cur2:
             for record in cur2:
-                new_ticket = libcrawler.TicketInfo(None, unicode(record[3], "utf-8"), record[4], record[5], record[6])
+                if not unicode_results:
+                    record = [unicode(col, "utf-8") if isinstance(col, str) else col for col in record]
+
+                new_ticket = libcrawler.TicketInfo(None, record[3], record[4], record[5], record[6])
                 vendor_event_id = int(record[9])
 
                 # first event or new event?
                 if current_event is None or current_event.vendor_event_id != vendor_event_id:
                     if current_event is not None:
-                        event_list.append(current_event)
+                        yield current_event
 
-                    current_event = libcrawler.EventInfo(None, None, unicode(record[1], "utf-8"), record[8])
-                    current_event.vendor_name     = unicode(record[7], "utf-8")
-                    current_event.venue_state     = unicode(record[2], "utf-8")
+                    current_event = libcrawler.EventInfo(None, None, record[1], record[8])
+                    current_event.vendor_name     = record[7]
+                    current_event.venue_state     = record[2]
                     current_event.event_datetime  = record[0]
                     current_event.vendor_event_id = vendor_event_id
 
+                    if len(record) > 10:
+                        current_event.search_rank = record[10]
+
                 current_event.ticket_list.append(new_ticket)
 
             # save last event too
             if current_event is not None:
-                event_list.append(current_event)
+                yield current_event
+
+
+# max number of events listed per page
+page_size = 50
+
+page_cursor_datetime_format = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+class EventsPage(object):
+    """ 
+        A page of events, loaded as it's iterated unless load is called first. The events
+        are loaded with one event more than fits on the page, if it's there next_url links
+        to the next page once the page has been read.
+    """
+
+    def __init__(self, event_iter, make_next_url):
+        self.event_iter    = event_iter
+        self.make_next_url = make_next_url
+        self.next_url      = None
+        self.loaded_events = None
+
+    def __iter__(self):
+        if self.loaded_events is not None:
+            return iter(self.loaded_events)
+
+        return self.read_events()
+
+    def load(self):
+        """ Reads the page's (at most page_size) events in, so it can be iterated once its connection's released. """
+        self.loaded_events = list(self.read_events())
+
+    def read_events(self):
+        last_event = None
+
+        try:
+            for num_events, event_info in enumerate(self.event_iter):
+                if num_events == page_size:
+                    self.next_url = self.make_next_url(make_page_cursor(last_event))
+                    break
+
+                last_event = event_info
+                yield event_info
+        finally:
+            # done with the stored proc's cursor even if there are unread rows left
+            self.event_iter.close()
+
+
+def make_page_cursor(event_info):
+    """ Cursor for the page after event_info: its search rank (if searched), timestamp & id. """
+    cursor_parts = [event_info.event_datetime.strftime(page_cursor_datetime_format), str(event_info.vendor_event_id)]
+
+    if event_info.search_rank is not None:
+        cursor_parts.insert(0, str(event_info.search_rank))
+
+    return "_".join(cursor_parts)
+
 
-    return event_list
+def parse_page_cursor(page_cursor, ranked):
+    """ 
+        Stored proc args for the page after page_cursor: (rank,) timestamp & id,
+        all None for the first page or if the cursor is malformed.
+    """
+    num_parts = 3 if ranked else 2
 
+    if page_cursor:
+        cursor_parts = page_cursor.split("_")
 
-def load_soon_events(db_con):
-    """ Loads next weeks events. Used for default homepage listing.  """
-    return load_events(db_con, "ozevnts.get_soon_events", ["soon_events_curname"])
+        if len(cursor_parts) == num_parts:
+            try:
+                args = [datetime.datetime.strptime(cursor_parts[-2], page_cursor_datetime_format),
+                        int(cursor_parts[-1])]
 
+                if ranked:
+                    args.insert(0, decimal.Decimal(cursor_parts[0]))
 
-def search_events(db_con, query, state, category):
-    """ Find events matching name, state and/or category. """
-    return load_events(db_con, "ozevnts.find_events", ["find_events_curname", query, state, category])
+                return args
+            except (ValueError, decimal.InvalidOperation):
+                logging.warning("Ignoring malformed page cursor: " + page_cursor)
+
+    return [None] * num_parts
+
+
+def load_soon_events(db_con, page_cursor):
+    """ Loads a page of next weeks events. Used for default homepage listing.  """
+    return iter_events(db_con, "ozevnts.get_soon_events",
+                       ["soon_events_curname"] + parse_page_cursor(page_cursor, False) + [page_size + 1])
+
+
+def load_data_version(db_con):
+    """ Version of the event data, changes whenever a change to events or their tickets is committed. """
+    with db_con.cursor() as cur1:
+        cur1.callproc("ozevnts.get_data_version")
+        return cur1.fetchone()[0]
+
+
+def search_events(db_con, query, state, category, page_cursor):
+    """ Find a page of events matching name, state and/or category. """
+    return iter_events(db_con, "ozevnts.find_events",
+                       ["find_events_curname", query, state, category] + parse_page_cursor(page_cursor, True) +
+                       [page_size + 1])
 
 
 mobile_user_agent_regex = re.compile(
@@ -67,19 +173,69 @@ logging.basicConfig(
 app = Flask(__name__)
 
 
+def get_db_pool():
+    return dbpool.get_db_pool(dbconnector.DbConnector.get_db_str(ABS_PATH + "/util"), unicode_results)
+
+
+# rendered homepage per template
+homepage_cache = pagecache.PageCache()
+
+
+def get_data_version():
+    with get_db_pool().connection() as db_con:
+        return load_data_version(db_con)
+
+
+# number of template chunks (roughly table rows) buffered per write when streaming
+stream_buffer_size = 20
+
+
+def stream_template(template_name, **context):
+    """ Renders a template a few chunks at a time, see "Streaming from Templates" in the Flask docs. """
+    app.update_template_context(context)
+    template_stream = app.jinja_env.get_template(template_name).stream(context)
+    template_stream.enable_buffering(stream_buffer_size)
+
+    return template_stream
+
+
+def render_events_page(template_name, load_page_events, make_next_url, **context):
+    """ 
+        Yields a page of events rendered into the template. The page is loaded before any of
+        it's streamed, so the pooled connection is released rather than held while a slow
+        client reads the response (a few of which could otherwise tie up the whole pool).
+    """
+    with get_db_pool().connection() as db_con:
+        events_page = EventsPage(load_page_events(db_con), make_next_url)
+        events_page.load()
+
+    for chunk in stream_template(template_name, events_page=events_page, **context):
+        yield chunk
+
+
+def render_soon_events(template_name, page_cursor):
+    return render_events_page(template_name, lambda db_con: load_soon_events(db_con, page_cursor),
+                              lambda next_cursor: url_for("render_this_week_events", After=next_cursor),
+                              selected_event="", selected_state="All", selected_category=0)
+
+
 @app.route("/")
 def render_this_week_events():
-    with psycopg2.connect(dbconnector.DbConnector.get_db_str(ABS_PATH + "/util")) as db_con:
-        template_name = "index.html"
-        if is_mobile_device(request.user_agent.string):
-            template_name = "mobindex.html"
+    template_name = "index.html"
+    if is_mobile_device(request.user_agent.string):
+        template_name = "mobindex.html"
 
-        return render_template(template_name, event_list=load_soon_events(db_con), selected_event="",
-                               selected_state="All", selected_category=0)
+    # only the first page is cached, it's the one nearly every visitor sees
+    page_cursor = request.args.get("After")
+    if page_cursor:
+        return Response(stream_with_context(render_soon_events(template_name, page_cursor)), mimetype="text/html")
 
+    return homepage_cache.get(template_name, get_data_version,
+                              lambda: u"".join(render_soon_events(template_name, None)))
 
-@app.route("/search")
-def render_search_results():
+
+def get_search_args():
+    """ Search event, state & category request args. """
     event    = request.args.get("Event")
     state    = request.args.get("State")
     category = request.args.get("Category")
@@ -93,13 +249,123 @@ def render_search_results():
     if category is None:
         category = 0
 
-    with psycopg2.connect(dbconnector.DbConnector.get_db_str(ABS_PATH + "/util")) as db_con:
-        template_name = "index.html"
-        if is_mobile_device(request.user_agent.string):
-            template_name = "mobindex.html"
+    return event, state, category
+
+
+@app.route("/search")
+def render_search_results():
+    event, state, category = get_search_args()
+    page_cursor = request.args.get("After")
+
+    template_name = "index.html"
+    if is_mobile_device(request.user_agent.string):
+        template_name = "mobindex.html"
+
+    search_results = render_events_page(
+        template_name, lambda db_con: search_events(db_con, event, state, category, page_cursor),
+        lambda next_cursor: url_for("render_search_results", Event=event, State=state, Category=category,
+                                    After=next_cursor),
+        selected_event=event, selected_state=state, selected_category=category)
+
+    return Response(stream_with_context(search_results), mimetype="text/html")
+
+
+# how long api clients may reuse a response before revalidating it
+api_max_age_sec = 15
+
+# api etags also change this often, so listings move on as events start even without data changes
+api_etag_period_sec = 60
+
+
+def event_to_api_dict(event_info):
+    """ Prices are sent as decimal strings, so they stay exact. """
+    return {"id":       event_info.vendor_event_id,
+            "name":     event_info.event_name,
+            "state":    event_info.venue_state,
+            "datetime": event_info.event_datetime.strftime("%Y-%m-%dT%H:%M:%S"),
+            "vendor":   event_info.vendor_name,
+            "url":      event_info.url,
+            "tickets":  [{"type":     ticket_info.ticket_type,
+                          "price":    str(ticket_info.ticket_price),
+                          "fee":      str(ticket_info.booking_fee),
+                          "sold_out": ticket_info.sold_out is not None} for ticket_info in event_info.ticket_list]}
+
+
+def gzip_data(data):
+    gzip_buffer = StringIO.StringIO()
+
+    with gzip.GzipFile(fileobj=gzip_buffer, mode="wb", compresslevel=6) as gzip_file:
+        gzip_file.write(data)
+
+    return gzip_buffer.getvalue()
+
+
+def api_events_response(load_page_events, make_next_url):
+    """ 
+        Compact json response of a page of events, gzipped if the client accepts it. The
+        etag is derived from the data version so repeat polls get a 304 without a query.
+    """
+    use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    etag     = "v" + str(homepage_cache.current_data_version(get_data_version)) + "." + str(
+        int(time.time() // api_etag_period_sec)) + ("-gzip" if use_gzip else "")
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        with get_db_pool().connection() as db_con:
+            events_page = EventsPage(load_page_events(db_con), make_next_url)
+            event_dicts = [event_to_api_dict(event_info) for event_info in events_page]
+
+        response_data = json.dumps({"events": event_dicts, "next": events_page.next_url}, separators=(",", ":"))
+
+        if use_gzip:
+            response_data = gzip_data(response_data)
+
+        response = Response(response_data, mimetype="application/json")
+
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=" + str(api_max_age_sec)
+    response.headers["Vary"]          = "Accept-Encoding"
+
+    return response
+
+
+@app.route("/api/events/soon")
+def api_soon_events():
+    """ Json api version of the homepage listing. """
+    page_cursor = request.args.get("After")
+
+    return api_events_response(lambda db_con: load_soon_events(db_con, page_cursor),
+                               lambda next_cursor: url_for("api_soon_events", After=next_cursor))
+
+
+@app.route("/api/events/search")
+def api_search_events():
+    """ Json api version of search, takes the same args as /search. """
+    event, state, category = get_search_args()
+    page_cursor = request.args.get("After")
+
+    return api_events_response(
+        lambda db_con: search_events(db_con, event, state, category, page_cursor),
+        lambda next_cursor: url_for("api_search_events", Event=event, State=state, Category=category,
+                                    After=next_cursor))
+
+
+# addresses allowed to scrape /metrics. requests relayed by a proxy are always refused,
+# as they'd otherwise seem to come from the proxy's (often local) address
+metrics_allowed_addrs = frozenset(["127.0.0.1", "::1"])
+
+
+@app.route("/metrics")
+def render_metrics():
+    """ This worker process' metrics, in the Prometheus text format, for internal scrapers only. """
+    if request.remote_addr not in metrics_allowed_addrs or "X-Forwarded-For" in request.headers:
+        abort(404)
 
-        return render_template(template_name, event_list=search_events(db_con, event, state, category),
-                               selected_event=event, selected_state=state, selected_category=category)
+    return Response(metrics.render_text(), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == '__main__':
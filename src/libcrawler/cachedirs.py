@@ -0,0 +1,24 @@
+import os
+import errno
+
+"""
+    Where the crawlers keep their on-disk caches: http validators, rate limit state
+    & known url bloom filters. Directories are only created when first written to,
+    so crawlers which never write (eg. in the benches) leave nothing behind.
+"""
+
+# relative to the working directory, set OZEVNTS_CACHE_DIR to keep the caches elsewhere
+cache_root = os.environ.get("OZEVNTS_CACHE_DIR", "cache")
+
+
+def cache_dir(*names):
+    return os.path.join(cache_root, *names)
+
+
+def make_dirs(dir_path):
+    """ Creates a cache directory & its parents if they don't exist yet. """
+    try:
+        os.makedirs(dir_path)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
@@ -0,0 +1,175 @@
+import Queue
+import logging
+import threading
+import psycopg2
+
+import crawlerfactory
+import parsepool
+from util import dbconnector
+
+# put on a vendor's results by fetch workers once each of its pages is fetched
+page_fetched = object()
+
+
+class CrawlEngine(object):
+    """
+        Crawls several vendors at once in one process, as a pipeline of bounded queues between
+        shared worker pools. Each vendor's crawl cycle runs on its own thread & db connection,
+        doing its search pages & db writes as ICrawler.run does, but hands its event pages to
+        the engine (see ICrawler.process_event_pages): fetch workers fetch them, parse workers
+        extract their tickets, and the results go back to the vendor's thread to be saved.
+        Queues are bounded & each vendor only has so many pages in flight, so a slow stage holds
+        back the ones before it rather than pages piling up in memory. Of those, at most the
+        vendor's max_concurrent_fetches are being fetched at once, as when it crawls alone.
+        Given a ParsePool, parse workers hand pages on to its worker processes, so there's
+        a parse worker per process to keep them all busy.
+    """
+
+    def __init__(self, db_str, num_fetch_workers=16, num_parse_workers=2, queue_size=32, parse_pool=None):
+        self.db_str            = db_str
+        self.num_fetch_workers = num_fetch_workers
+        self.num_parse_workers = num_parse_workers if parse_pool is None else parse_pool.num_workers
+        self.parse_pool        = parse_pool
+        self.fetch_queue       = Queue.Queue(queue_size)
+        self.parse_queue       = Queue.Queue(queue_size)
+
+    # START - PIPELINE STAGES #
+    def process_event_pages(self, crawler, event_info_list):
+        """
+            Feeds a crawler's event pages into the pipeline, yielding (event_info, event_response,
+            page_error) as they come out the other end. At most pages_in_flight of the crawler's
+            pages are in the pipeline at once, which keeps other vendors' pages moving too, and
+            only max_concurrent_fetches of them are fed to the fetch workers at a time. Fetch
+            workers put page_fetched on results as each fetch finishes, so the next can be fed.
+        """
+        results         = Queue.Queue()
+        event_info_iter = iter(event_info_list)
+        num_in_flight   = 0
+        num_fetching    = 0
+
+        while True:
+            while num_fetching < crawler.max_concurrent_fetches and num_in_flight < self.pages_in_flight(crawler):
+                event_info = next(event_info_iter, None)
+
+                if event_info is None:
+                    break
+
+                self.fetch_queue.put((crawler, event_info, results))
+                num_in_flight += 1
+                num_fetching  += 1
+
+            if num_in_flight == 0:
+                return
+
+            page_result = results.get()
+
+            if page_result is page_fetched:
+                num_fetching -= 1
+            else:
+                num_in_flight -= 1
+                yield page_result
+
+    def pages_in_flight(self, crawler):
+        return crawler.max_concurrent_fetches * 2
+
+    def fetch_worker(self):
+        while True:
+            fetch_work = self.fetch_queue.get()
+
+            if fetch_work is None:
+                return
+
+            crawler, event_info, results = fetch_work
+            event_info, event_response, page_error = crawler.fetch_event_page(event_info)
+            results.put(page_fetched)
+
+            if page_error is None:
+                self.parse_queue.put((crawler, event_info, event_response, results))
+            else:
+                results.put((event_info, event_response, page_error))
+
+    def parse_worker(self):
+        while True:
+            parse_work = self.parse_queue.get()
+
+            if parse_work is None:
+                return
+
+            crawler, event_info, event_response, results = parse_work
+            results.put((event_info, event_response, crawler.parse_event_page(event_info, event_response)))
+    # END - PIPELINE STAGES #
+
+    def crawl_vendor(self, vendor_id, failed_vendor_ids):
+        """ Runs a vendor's crawl cycle with its event pages going through the pipeline. """
+        try:
+            with psycopg2.connect(self.db_str) as conn:
+                crawler = crawlerfactory.CrawlerFactory(conn).get_crawler(vendor_id)
+
+                if crawler is None:
+                    error_msg = "No crawler found for vendor_id: " + str(vendor_id)
+                    logging.error(error_msg)
+                    raise Exception(error_msg)
+
+                crawler.page_pipeline = self
+                crawler.parse_pool    = self.parse_pool
+                crawler.run()
+        except Exception:
+            # the other vendors carry on
+            logging.exception("Crawl cycle failed for vendor_id: " + str(vendor_id))
+            failed_vendor_ids.append(vendor_id)
+
+    def start_workers(self, num_workers, target):
+        workers = [threading.Thread(target=target) for idx in range(num_workers)]
+
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        return workers
+
+    def stop_workers(self, workers, work_queue):
+        for worker in workers:
+            work_queue.put(None)
+
+        for worker in workers:
+            worker.join()
+
+    def run(self, vendor_ids):
+        """ Performs one crawl cycle of each vendor concurrently, returning the ids of any which failed. """
+        failed_vendor_ids = []
+        fetch_workers     = self.start_workers(self.num_fetch_workers, self.fetch_worker)
+        parse_workers     = self.start_workers(self.num_parse_workers, self.parse_worker)
+        vendor_threads    = [threading.Thread(target=self.crawl_vendor, args=(vendor_id, failed_vendor_ids))
+                             for vendor_id in vendor_ids]
+
+        for vendor_thread in vendor_threads:
+            vendor_thread.start()
+
+        for vendor_thread in vendor_threads:
+            vendor_thread.join()
+
+        # fetch workers first, as they feed the parse workers
+        self.stop_workers(fetch_workers, self.fetch_queue)
+        self.stop_workers(parse_workers, self.parse_queue)
+
+        return failed_vendor_ids
+
+
+def run(vendor_ids, num_parse_processes=0):
+    """ 
+        Crawls the given vendors together in a CrawlEngine, raising if any of their cycles failed.
+        Pages are parsed in a ParsePool of num_parse_processes worker processes if it's above 0.
+    """
+    parse_pool = parsepool.ParsePool(num_parse_processes) if num_parse_processes > 0 else None
+    engine     = CrawlEngine(dbconnector.DbConnector.get_db_str("util"), parse_pool=parse_pool)
+
+    try:
+        failed_vendor_ids = engine.run(vendor_ids)
+    finally:
+        if parse_pool is not None:
+            parse_pool.close()
+
+    if failed_vendor_ids:
+        error_msg = "Crawl cycles failed for vendor_ids: " + str(failed_vendor_ids)
+        logging.error(error_msg)
+        raise Exception(error_msg)
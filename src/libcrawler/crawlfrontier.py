@@ -0,0 +1,108 @@
+import logging
+
+# frontier url types & states, see ozevnts.crawl_frontier
+SEARCH_PAGE = "S"
+EVENT_PAGE  = "E"
+
+PENDING     = "P"
+ATTEMPTED   = "A"
+DONE        = "D"
+QUARANTINED = "Q"
+
+
+class CrawlFrontier(object):
+    """
+        Persistent progress of a vendor's crawl cycle, so a cycle which dies part way through
+        resumes where it left off rather than starting over. Search pages are checkpointed as
+        they're done & skipped when resuming. Pages which fail, or which have been attempted
+        max_attempts times without finishing (ie. keep killing the crawler), are quarantined
+        instead of aborting the cycle. Quarantined event pages stay skipped by later cycles
+        until quarantine_period has passed, search pages only for the rest of their cycle.
+    """
+
+    def __init__(self, db_con, vendor_id, max_attempts=3, quarantine_period="7 days"):
+        self.db_con            = db_con
+        self.vendor_id         = vendor_id
+        self.max_attempts      = max_attempts
+        self.quarantine_period = quarantine_period
+        self.entries           = {}
+
+    def start(self):
+        """ Starts a crawl cycle, or picks up the one left unfinished. Returns True if resuming. """
+        with self.db_con.cursor() as cur1:
+            cur1.callproc("ozevnts.start_crawl_cycle", [self.vendor_id])
+            resuming = cur1.fetchone()[0]
+
+        self.db_con.commit()
+        self.entries = {}
+
+        with self.db_con.cursor() as cur1:
+            cur1.callproc("ozevnts.get_crawl_frontier", ["crawl_frontier_curname", self.vendor_id])
+
+            with self.db_con.cursor("crawl_frontier_curname") as cur2:
+                for record in cur2:
+                    self.entries[record[0]] = [record[1], record[2], record[3]]
+
+        return resuming
+
+    def finish(self):
+        """ Clears the finished cycle's search pages & any event pages out of quarantine. """
+        with self.db_con.cursor() as cur1:
+            cur1.callproc("ozevnts.finish_crawl_cycle", [self.vendor_id, self.quarantine_period])
+
+        self.db_con.commit()
+        self.entries = {}
+
+    def set_state(self, url, url_type, state, error_msg=None):
+        """ Records a url's state, committing straight away so it's kept if the crawler dies. """
+        with self.db_con.cursor() as cur1:
+            cur1.callproc("ozevnts.set_crawl_url_state", [self.vendor_id, url, url_type, state, error_msg])
+
+        self.db_con.commit()
+
+        entry = self.entries.setdefault(url, [url_type, state, 0])
+        entry[1] = state
+
+        if state == ATTEMPTED:
+            entry[2] += 1
+
+    def is_finished(self, url):
+        """ True if the url was done or quarantined before, so shouldn't be fetched again. """
+        entry = self.entries.get(url)
+        return entry is not None and entry[1] in (DONE, QUARANTINED)
+
+    def is_quarantined(self, url):
+        entry = self.entries.get(url)
+        return entry is not None and entry[1] == QUARANTINED
+
+    def attempt(self, url, url_type):
+        """
+            Records an attempt at a url before processing it. Returns False, having quarantined
+            it, if it's already been attempted max_attempts times without being done.
+        """
+        entry = self.entries.get(url)
+
+        if entry is not None and entry[2] >= self.max_attempts:
+            self.quarantine(url, url_type, "Not done after " + str(entry[2]) + " attempts")
+            return False
+
+        self.set_state(url, url_type, ATTEMPTED)
+        return True
+
+    def done(self, url, url_type):
+        self.set_state(url, url_type, DONE)
+
+    def quarantine(self, url, url_type, error_msg):
+        logging.error("Quarantining url: " + url + ", " + error_msg)
+        self.set_state(url, url_type, QUARANTINED, error_msg)
+
+    def fail(self, url, url_type, error_msg, num_failures):
+        """ 
+            Records a failure at a url processed outside a crawl cycle (ie. an event page being
+            refreshed), num_failures being how many it's had before. Urls which have failed
+            max_attempts times within quarantine_period are quarantined.
+        """
+        if num_failures + 1 >= self.max_attempts:
+            self.quarantine(url, url_type, error_msg)
+        else:
+            self.set_state(url, url_type, ATTEMPTED, error_msg)
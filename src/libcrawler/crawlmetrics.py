@@ -0,0 +1,47 @@
+from util import metrics
+
+"""
+    Metrics of the crawl & refresh cycles. Jobs run in worker processes, which send
+    snapshots of these back to the work scheduler (see workscheduler.exec_job) to be
+    served from its metrics endpoint.
+"""
+
+cycle_buckets    = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+db_buckets       = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+cycle_seconds    = metrics.Histogram("ozevnts_crawl_cycle_seconds",
+                                     "Duration of whole crawler & refresher runs, by job.",
+                                     ("job",), cycle_buckets)
+fetch_seconds    = metrics.Histogram("ozevnts_crawl_fetch_seconds",
+                                     "Latency of http requests to vendors, per attempt.",
+                                     ("vendor",))
+parse_seconds    = metrics.Histogram("ozevnts_crawl_parse_seconds",
+                                     "Time spent parsing vendor pages, by page type.",
+                                     ("vendor", "page_type"))
+db_seconds       = metrics.Histogram("ozevnts_crawl_db_seconds",
+                                     "Time spent on db calls (including commits), by operation.",
+                                     ("vendor", "operation"), db_buckets)
+pages            = metrics.Counter("ozevnts_crawl_pages_total",
+                                   "Vendor pages, by page type & result (eg. changed, quarantined, not_paged).",
+                                   ("vendor", "page_type", "result"))
+new_events       = metrics.Counter("ozevnts_crawl_new_events_total",
+                                   "New events saved by crawlers.",
+                                   ("vendor",))
+refreshed_events = metrics.Counter("ozevnts_crawl_refreshed_events_total",
+                                   "Events refreshed, by whether their page had changed, was invalid or failed.",
+                                   ("vendor", "result"))
+updated_tickets  = metrics.Counter("ozevnts_crawl_updated_tickets_total",
+                                   "Tickets added, changed or sold out by refreshes.",
+                                   ("vendor",))
+http_retries     = metrics.Counter("ozevnts_crawl_http_retries_total",
+                                   "Http requests to vendors retried, by reason.",
+                                   ("vendor", "reason"))
+http_timeouts    = metrics.Counter("ozevnts_crawl_http_timeouts_total",
+                                   "Http requests to vendors which timed out.",
+                                   ("vendor",))
+rate_limit_wait_seconds = metrics.Histogram("ozevnts_crawl_rate_limit_wait_seconds",
+                                            "Time requests waited on their host's rate limit.",
+                                            ("host",), db_buckets)
+rate_limit_factor = metrics.Gauge("ozevnts_crawl_rate_limit_factor",
+                                  "Fraction of its max request rate each host is currently throttled to.",
+                                  ("host",))
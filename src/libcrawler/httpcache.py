@@ -0,0 +1,99 @@
+import os
+import json
+import errno
+import hashlib
+import logging
+
+import cachedirs
+
+
+def vendor_http_cache(vendor_id):
+    """ The http cache of a vendor's pages, shared by its crawler, the refresher & the archiver. """
+    return HttpCache(cachedirs.cache_dir("http", str(vendor_id)))
+
+
+class HttpCache(object):
+    """
+        On-disk cache of the validators (ETag/Last-Modified) and body hash of
+        fetched pages, keyed by url. Used to make conditional requests and to
+        skip parsing pages which haven't changed since they were last processed.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def entry_path(self, url):
+        if isinstance(url, unicode):
+            url = url.encode("utf-8")
+
+        return os.path.join(self.cache_dir, hashlib.sha1(url).hexdigest() + ".json")
+
+    def load(self, url):
+        """ Returns the cache entry for a url, or None if it has none. """
+        try:
+            with open(self.entry_path(url)) as entry_file:
+                return json.load(entry_file)
+        except IOError:
+            return None
+        except ValueError:
+            logging.error("Ignoring corrupt http cache entry for url: " + url)
+            return None
+
+    def conditional_headers(self, url):
+        """ Request headers to only fetch a url if it has changed since it was stored. """
+        headers = {}
+        entry   = self.load(url)
+
+        if entry is not None:
+            if entry["etag"] is not None:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"] is not None:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        return headers
+
+    def is_unchanged(self, url, response):
+        """ True if the response was a 304, or has the same body as the stored entry for the url. """
+        if response.status_code == 304:
+            return True
+
+        entry = self.load(url)
+        return entry is not None and entry["body_hash"] == hashlib.sha1(response.content).hexdigest()
+
+    def store(self, url, response, meta=None, stale=False):
+        """
+            Stores a successfully processed response for a url, with optional meta data
+            needed to carry on when the url is next found to be unchanged. A stale entry
+            keeps only the meta data, so the url is never found unchanged.
+        """
+        if response.status_code != 200:
+            return
+
+        entry = {"url":           url,
+                 "etag":          None,
+                 "last_modified": None,
+                 "body_hash":     None,
+                 "meta":          meta}
+
+        if not stale:
+            entry["etag"]          = response.headers.get("ETag")
+            entry["last_modified"] = response.headers.get("Last-Modified")
+            entry["body_hash"]     = hashlib.sha1(response.content).hexdigest()
+
+        # write then rename so readers never see a partially written entry
+        entry_path = self.entry_path(url)
+        tmp_path   = entry_path + "." + str(os.getpid()) + ".tmp"
+        cachedirs.make_dirs(self.cache_dir)
+
+        with open(tmp_path, "w") as entry_file:
+            json.dump(entry, entry_file)
+
+        os.rename(tmp_path, entry_path)
+
+    def remove(self, url):
+        """ Removes a url's entry, for pages which won't be fetched again. """
+        try:
+            os.remove(self.entry_path(url))
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
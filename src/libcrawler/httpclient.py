@@ -0,0 +1,103 @@
+import time
+import random
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+
+import crawlmetrics
+
+
+def retry_after_sec(response):
+    """ A response's Retry-After in seconds, None if it has none (or gave an http date). """
+    try:
+        return int(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient(object):
+    """
+        Shared http client for a vendor. Keeps one keep-alive session (and so one
+        connection pool & cookie jar) for the life of the crawler, applies connect/read
+        timeouts and retries failed requests with capped exponential backoff.
+        Request latencies, retries & timeouts are recorded under metrics_label (the vendor).
+        Requests wait on rate_limiter if given, and feed their outcomes back to it.
+    """
+
+    user_agent     = "Mozilla/5.0"
+    retry_statuses = frozenset([429, 500, 502, 503, 504])
+
+    def __init__(self, pool_size=4, connect_timeout_sec=10, read_timeout_sec=30, max_retries=5,
+                 backoff_base_sec=2, backoff_max_sec=120, metrics_label="none", rate_limiter=None):
+        self.timeout          = (connect_timeout_sec, read_timeout_sec)
+        self.max_retries      = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec  = backoff_max_sec
+        self.fetch_seconds    = crawlmetrics.fetch_seconds.labels(metrics_label)
+        self.metrics_label    = metrics_label
+        self.rate_limiter     = rate_limiter
+
+        # retries are handled here rather than by the adapter so they can back off
+        adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=0)
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = HttpClient.user_agent
+        self.session.mount("http://",  adapter)
+        self.session.mount("https://", adapter)
+
+    def backoff_sec(self, attempt):
+        """ Capped exponential backoff with jitter for the given (1-based) retry attempt. """
+        backoff_sec = min(self.backoff_max_sec, self.backoff_base_sec * (2 ** (attempt - 1)))
+        return backoff_sec / 2.0 + random.uniform(0, backoff_sec / 2.0)
+
+    def record_response(self, url, status_code, response_sec, retry_after=None):
+        self.fetch_seconds.observe(response_sec)
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.record_response(url, status_code, response_sec, retry_after)
+
+    def get(self, url, **kwargs):
+        """ GETs a url, retrying timeouts, connection errors & transient http errors. """
+        attempt = 0
+
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(url)
+
+            request_start = time.time()
+
+            try:
+                logging.info("Opening url: " + url)
+                response = self.session.get(url, timeout=self.timeout, **kwargs)
+                self.record_response(url, response.status_code, time.time() - request_start,
+                                     retry_after_sec(response))
+
+                if response.status_code not in HttpClient.retry_statuses:
+                    # for debugging raw response data
+                    #out_file = codecs.open("output.html", "w", "utf-8")
+                    #out_file.write(response.text)
+                    #out_file.close()
+                    return response
+
+                failure = "http status " + str(response.status_code)
+                reason  = str(response.status_code)
+            except (requests.Timeout, requests.ConnectionError), e:
+                self.record_response(url, None, time.time() - request_start)
+                failure = e.__class__.__name__ + ": " + str(e)
+                reason  = e.__class__.__name__
+
+                if isinstance(e, requests.Timeout):
+                    crawlmetrics.http_timeouts.labels(self.metrics_label).inc()
+
+            attempt += 1
+
+            if attempt > self.max_retries:
+                error_msg = "Giving up on url: " + url + " after " + str(attempt) + " attempts, last failure: " + \
+                    failure
+                logging.error(error_msg)
+                raise Exception(error_msg)
+
+            crawlmetrics.http_retries.labels(self.metrics_label, reason).inc()
+            backoff_sec = self.backoff_sec(attempt)
+            logging.debug("Received " + failure + ", retrying in " + str(backoff_sec) + " seconds...")
+            time.sleep(backoff_sec)
@@ -0,0 +1,129 @@
+import os
+import json
+import math
+import struct
+import hashlib
+import logging
+
+import cachedirs
+
+
+def load_known_urls(db_con, vendor_id, min_vendor_event_id, add_func):
+    """ Streams (url, vendor_event_id) of a vendor's events with ids above min_vendor_event_id into add_func. """
+    with db_con.cursor() as cur1:
+        cur1.callproc("ozevnts.get_known_urls", ["known_urls_curname", vendor_id, min_vendor_event_id])
+
+        with db_con.cursor("known_urls_curname") as cur2:
+            for record in cur2:
+                add_func(record[0], record[1])
+
+
+class KnownUrlIndex(object):
+    """
+        Exact in-memory index of a vendor's known urls. Loaded once per crawl
+        cycle, then kept up to date as new events are saved.
+    """
+
+    def __init__(self, db_con, vendor_id):
+        self.db_con    = db_con
+        self.vendor_id = vendor_id
+        self.urls      = set()
+
+    def load(self):
+        load_known_urls(self.db_con, self.vendor_id, 0, self.add)
+        logging.info("Loaded " + str(len(self.urls)) + " known urls.")
+
+    def add(self, url, vendor_event_id):
+        self.urls.add(url)
+
+    def save(self):
+        return
+
+    def __contains__(self, url):
+        return url in self.urls
+
+
+class BloomKnownUrlIndex(object):
+    """
+        Known url index backed by a Bloom filter saved on disk, so memory stays flat
+        however many urls a vendor has had. Each cycle only loads urls saved since
+        the filter was last saved, and filter hits are confirmed exactly in the db.
+    """
+
+    def __init__(self, db_con, vendor_id, capacity, cache_dir=None, false_positive_rate=0.01):
+        self.db_con     = db_con
+        self.vendor_id  = vendor_id
+        self.capacity   = capacity
+        self.cache_dir  = cache_dir or cachedirs.cache_dir("known_urls")
+        self.file_path  = os.path.join(self.cache_dir, str(vendor_id) + ".bloom")
+        self.num_bits   = int(math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.num_hashes = int(round(self.num_bits * math.log(2) / capacity))
+        self.bits       = None
+        self.num_urls   = 0
+        self.max_vendor_event_id = 0
+
+    def bit_positions(self, url):
+        if isinstance(url, unicode):
+            url = url.encode("utf-8")
+
+        # double hashing: k positions from the two halves of one md5
+        hash1, hash2 = struct.unpack("<QQ", hashlib.md5(url).digest())
+        return [(hash1 + idx * hash2) % self.num_bits for idx in range(self.num_hashes)]
+
+    def load(self):
+        """ Loads the saved filter (if its sizing still matches) then any urls saved since. """
+        self.bits = None
+
+        try:
+            with open(self.file_path, "rb") as bloom_file:
+                header = json.loads(bloom_file.readline())
+
+                if header["num_bits"] == self.num_bits and header["num_hashes"] == self.num_hashes:
+                    self.bits     = bytearray(bloom_file.read())
+                    self.num_urls = header["num_urls"]
+                    self.max_vendor_event_id = header["max_vendor_event_id"]
+        except IOError:
+            pass
+
+        if self.bits is None or len(self.bits) != (self.num_bits + 7) // 8:
+            logging.info("Rebuilding known url bloom filter for vendor_id: " + str(self.vendor_id))
+            self.bits     = bytearray((self.num_bits + 7) // 8)
+            self.num_urls = 0
+            self.max_vendor_event_id = 0
+
+        load_known_urls(self.db_con, self.vendor_id, self.max_vendor_event_id, self.add)
+
+        if self.num_urls > self.capacity:
+            logging.warning("Known url bloom filter holds " + str(self.num_urls) + " urls, over its capacity of " +
+                            str(self.capacity) + ", false positive rate will be higher than intended.")
+
+    def add(self, url, vendor_event_id):
+        for bit_position in self.bit_positions(url):
+            self.bits[bit_position >> 3] |= 1 << (bit_position & 7)
+
+        self.num_urls += 1
+        self.max_vendor_event_id = max(self.max_vendor_event_id, vendor_event_id)
+
+    def save(self):
+        """ Saves the filter, only call once everything added to it is committed. """
+        tmp_path = self.file_path + "." + str(os.getpid()) + ".tmp"
+        cachedirs.make_dirs(self.cache_dir)
+
+        with open(tmp_path, "wb") as bloom_file:
+            bloom_file.write(json.dumps({"num_bits":            self.num_bits,
+                                         "num_hashes":          self.num_hashes,
+                                         "num_urls":            self.num_urls,
+                                         "max_vendor_event_id": self.max_vendor_event_id}) + "\n")
+            bloom_file.write(self.bits)
+
+        os.rename(tmp_path, self.file_path)
+
+    def __contains__(self, url):
+        for bit_position in self.bit_positions(url):
+            if not self.bits[bit_position >> 3] & (1 << (bit_position & 7)):
+                return False
+
+        # probably known, confirm in the db to rule out a false positive
+        with self.db_con.cursor() as cur1:
+            cur1.callproc("ozevnts.is_known_url", [url])
+            return cur1.fetchone()[0]
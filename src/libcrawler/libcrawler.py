@@ -1,21 +1,30 @@
 import abc
 import time
-import requests
-import codecs
-import gc
 import logging
+import collections
+from multiprocessing.pool import ThreadPool
+
+import crawlmetrics
+import crawlfrontier
+import httpclient
+import ratelimiter
+import httpcache
+import knownurls
 
 #enable for testing memory usage
 #from guppy import hpy
 
 
-class VendorSearchListing:
+class VendorSearchListing(object):
     """ Vendor data for a event/ticket search listing. """
 
-    def __init__(self, vendor_id, event_type_id, search_url, paginated_ind):
-        self.vendor_id     = vendor_id
-        self.event_type_id = event_type_id
-        self.search_url    = search_url
+    __slots__ = ("vendor_id", "event_type_id", "search_url", "paginated_ind", "full_sweep_age_sec")
+
+    def __init__(self, vendor_id, event_type_id, search_url, paginated_ind, full_sweep_age_sec=None):
+        self.vendor_id          = vendor_id
+        self.event_type_id      = event_type_id
+        self.search_url         = search_url
+        self.full_sweep_age_sec = full_sweep_age_sec
 
         if paginated_ind is not None and paginated_ind == "Y":
             self.paginated_ind = True
@@ -27,8 +36,15 @@ class VendorSearchListing:
             self.event_type_id) + ", search_url: " + self.search_url + ", paginated_ind: " + str(self.paginated_ind)
 
 
-class EventInfo:
-    """ Event info extracted from search results & event pages or loaded from db. """
+class EventInfo(object):
+    """ 
+        Event info extracted from search results & event pages or loaded from db.
+        Slotted (as are TicketInfos) as the refresher & web pages hold many at once.
+    """
+
+    # vendor_name & search_rank are only set when loaded for the web pages, refresh_failures by the refresher
+    __slots__ = ("vendor_id", "event_type_id", "event_name", "url", "venue_name", "venue_state", "event_datetime",
+                 "invalid", "vendor_event_id", "ticket_list", "vendor_name", "search_rank", "refresh_failures")
 
     def __init__(self, vendor_id, event_type_id, event_name, url):
         self.vendor_id        = vendor_id
@@ -41,6 +57,9 @@ class EventInfo:
         self.invalid          = None
         self.vendor_event_id  = None
         self.ticket_list      = []
+        self.vendor_name      = None
+        self.search_rank      = None
+        self.refresh_failures = 0
 
     def invalid_db_val(self):
         if self.invalid:
@@ -55,34 +74,12 @@ class EventInfo:
             str(self.event_datetime) + ", invalid + " + str(self.invalid) + ", vendorEventId: " + \
             str(self.vendor_event_id)
 
-    def create_event(self, db_con):
-        with db_con.cursor() as cur1:
-            cur1.callproc("ozevnts.create_event",
-                          [self.vendor_id, self.event_type_id, self.event_name, self.venue_state, self.event_datetime,
-                           self.invalid_db_val(), self.url])
-
-            self.vendor_event_id = int(cur1.fetchone()[0])
-
-    def create_tickets(self, db_con):
-        """ Record a list of tickets for this event. """
-        if self.vendor_event_id is None:
-            error_msg = "Invalid VendorEventId; unable to create_tickets for eventName: " + self.event_name
-            logging.error(error_msg)
-            raise Exception(error_msg)
-        elif not self.invalid:
-            for ticketInfo in self.ticket_list:
-                ticketInfo.create(db_con, self.vendor_event_id)
-
-    def invalidate_event(self, db_con):
-        """ Updated an event as now being invalid. """
-        if self.invalid:
-            with db_con.cursor() as cur1:
-                cur1.callproc("ozevnts.invalidate_event", [self.vendor_event_id])
 
-
-class TicketInfo:
+class TicketInfo(object):
     """ Ticket info extracted from event page or loaded from db. """
 
+    __slots__ = ("ticket_num", "ticket_type", "ticket_price", "booking_fee", "sold_out")
+
     def __init__(self, ticket_num, ticket_type, ticket_price, booking_fee, sold_out):
         self.ticket_num   = ticket_num
         self.ticket_type  = ticket_type
@@ -101,45 +98,84 @@ class TicketInfo:
         return self.ticket_type != new_ticket.ticket_type or self.ticket_price != new_ticket.ticket_price or \
             self.booking_fee != new_ticket.booking_fee or self.sold_out != new_ticket.sold_out
 
-    def create(self, db_con, vendor_event_id):
-        with db_con.cursor() as cur1:
-            cur1.callproc("ozevnts.create_ticket",
-                          [vendor_event_id, self.ticket_num, self.ticket_type, self.ticket_price, self.booking_fee,
-                           self.sold_out_db_val()])
-
-    def update(self, db_con, vendor_event_id):
-        with db_con.cursor() as cur1:
-            cur1.callproc("ozevnts.update_ticket",
-                          [vendor_event_id, self.ticket_num, self.ticket_type, self.ticket_price, self.booking_fee,
-                           self.sold_out_db_val()])
-
     def __repr__(self):
         return "ticketNum: " + str(self.ticket_num) + ", ticket_type: " + self.ticket_type + ", ticket_price: " + str(
             self.ticket_price) + ", booking_fee: " + str(self.booking_fee) + ", sold_out: " + str(self.sold_out)
 
 
-# START - MISC UTILITY FUNCTIONS # 
-def fetch_url(url):
-    fetched = False
-    output  = None
+class EventBatch(object):
+    """ 
+        Accumulates new EventInfos so they and their tickets are inserted with one
+        round-trip each per batch, committing once per batch instead of per event.
+    """
 
-    while not fetched:
-        try:
-            logging.info("Opening url: " + url)
-            output  = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-            fetched = True
-        except requests.Timeout, e:
-            #timeout, wait 30 seconds and try again
-            logging.debug("Received timeout, retrying in 30 seconds...")
-            time.sleep(30)
+    def __init__(self, db_con, vendor_id, batch_size, known_urls):
+        self.db_con          = db_con
+        self.vendor_id       = vendor_id
+        self.batch_size      = batch_size
+        self.known_urls      = known_urls
+        self.event_info_list = []
+
+    def discard(self):
+        """ Drops the batched events without saving them, eg. after a failed flush. """
+        self.event_info_list = []
+
+    def add(self, event_info):
+        """ Adds an EventInfo to the batch, flushing it once full. """
+        self.event_info_list.append(event_info)
+
+        if len(self.event_info_list) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Creates all batched events & their tickets, then commits. """
+        if not self.event_info_list:
+            return
+
+        with crawlmetrics.db_seconds.labels(self.vendor_id, "create_events").time():
+            self.save_events()
 
-    # for debugging raw response data
-    #out_file = codecs.open("output.html", "w", "utf-8")
-    #out_file.write(output.text)
-    #out_file.close()
+        for event_info in self.event_info_list:
+            self.known_urls.add(event_info.url, event_info.vendor_event_id)
 
-    return output
-# END - MISC UTILITY FUNCTIONS #
+        crawlmetrics.new_events.labels(self.vendor_id).inc(len(self.event_info_list))
+        logging.info("Saved batch of " + str(len(self.event_info_list)) + " new events.")
+        self.event_info_list = []
+
+    def save_events(self):
+        """ Inserts the batched events, then their tickets, with one round-trip each. """
+        with self.db_con.cursor() as cur1:
+            # explicit casts as psycopg2 can't type arrays which are empty or all nulls
+            cur1.execute("select ozevnts.create_events(%s::integer[], %s::integer[], %s::text[], %s::text[], "
+                         "%s::text[], %s::timestamp without time zone[], %s::text[], %s::text[])",
+                         [[event_info.vendor_id        for event_info in self.event_info_list],
+                          [event_info.event_type_id    for event_info in self.event_info_list],
+                          [event_info.event_name       for event_info in self.event_info_list],
+                          [event_info.venue_name       for event_info in self.event_info_list],
+                          [event_info.venue_state      for event_info in self.event_info_list],
+                          [event_info.event_datetime   for event_info in self.event_info_list],
+                          [event_info.invalid_db_val() for event_info in self.event_info_list],
+                          [event_info.url              for event_info in self.event_info_list]])
+
+            ticket_cols = ([], [], [], [], [], [])
+
+            for event_info, vendor_event_id in zip(self.event_info_list, cur1.fetchone()[0]):
+                event_info.vendor_event_id = vendor_event_id
+
+                if not event_info.invalid:
+                    for ticket_info in event_info.ticket_list:
+                        ticket_cols[0].append(vendor_event_id)
+                        ticket_cols[1].append(ticket_info.ticket_num)
+                        ticket_cols[2].append(ticket_info.ticket_type)
+                        ticket_cols[3].append(ticket_info.ticket_price)
+                        ticket_cols[4].append(ticket_info.booking_fee)
+                        ticket_cols[5].append(ticket_info.sold_out_db_val())
+
+            if ticket_cols[0]:
+                cur1.execute("select ozevnts.create_tickets(%s::integer[], %s::integer[], %s::text[], "
+                             "%s::numeric[], %s::numeric[], %s::text[])", ticket_cols)
+
+        self.db_con.commit()
 
 
 class ICrawler(object):
@@ -147,7 +183,26 @@ class ICrawler(object):
     __metaclass__ = abc.ABCMeta
 
     def __init__(self, db_con):
-        self.db_con = db_con
+        self.db_con       = db_con
+        self.rate_limiter = ratelimiter.RateLimiter(self.max_requests_per_sec, self.max_concurrent_fetches)
+        self.http_client  = httpclient.HttpClient(self.max_concurrent_fetches, metrics_label=self.vendor_id,
+                                                  rate_limiter=self.rate_limiter)
+        self.http_cache   = httpcache.vendor_http_cache(self.vendor_id)
+        self.known_urls   = self.create_known_url_index()
+        self.event_batch  = EventBatch(db_con, self.vendor_id, self.db_batch_size, self.known_urls)
+        self.frontier     = crawlfrontier.CrawlFrontier(db_con, self.vendor_id)
+
+        # running count of new events found on search pages, see process_counted_search_page
+        self.num_new_events_found = 0
+
+        # running count of events on search pages which are or were just quarantined, see crawl_search_page
+        self.num_quarantined_events = 0
+
+        # set when crawling in a CrawlEngine, which fetches & parses event pages for all its crawlers
+        self.page_pipeline = None
+
+        # set to parse pages in a ParsePool's worker processes rather than in this one
+        self.parse_pool = None
 
     # START - ABSTRACT METHODS REQUIRING VENDOR-SPECIFIC IMPLEMENTATION #
     @abc.abstractmethod
@@ -166,55 +221,107 @@ class ICrawler(object):
         return
 
     @abc.abstractmethod
-    def fetch_event_url(self, url):
+    def fetch_event_url(self, url, **kwargs):
         """ 
             Some vendors do cookie checks with mess redirects which
             require unique handling in vendor-specific implementations.
         """
-        return fetch_url(url)
+        return self.http_client.get(url, **kwargs)
 
     @abc.abstractmethod
     def extract_event_and_ticket_info(self, event_type_id, known_urls, search_results):
         """ Extracts event & ticket info from retrieved search results. """
-        extracted_event_info_list = self.extract_new_events(event_type_id, known_urls, search_results)
-
-        while extracted_event_info_list:
-            extracted_event_info = extracted_event_info_list.pop()
-            event_page           = self.fetch_event_url(extracted_event_info.url).text
-            self.extract_ticket_info(extracted_event_info, event_page)
-            extracted_event_info.create_event(self.db_con)
-            extracted_event_info.create_tickets(self.db_con)
-
-            self.db_con.commit()
-            event_page           = None
-            extracted_event_info = None
-            gc.collect()
+        with crawlmetrics.parse_seconds.labels(self.vendor_id, "search").time():
+            if self.parse_pool is None:
+                extracted_event_info_list = self.extract_new_events(event_type_id, known_urls, search_results)
+            else:
+                extracted_event_info_list = self.parse_pool.extract_new_events(self, event_type_id, known_urls,
+                                                                               search_results)
+
+        num_extracted_events      = len(extracted_event_info_list)
+        extracted_event_info_list = [event_info for event_info in extracted_event_info_list
+                                     if not self.frontier.is_quarantined(event_info.url)]
+        self.num_new_events_found   += len(extracted_event_info_list)
+        self.num_quarantined_events += num_extracted_events - len(extracted_event_info_list)
+
+        # pages are fetched concurrently, but db writes stay on
+        # this thread so only the one db connection is ever used
+        for extracted_event_info, event_response, page_error in self.process_event_pages(extracted_event_info_list):
+            if page_error is not None:
+                self.quarantine_page(extracted_event_info.url, crawlfrontier.EVENT_PAGE, "event", page_error)
+                self.num_quarantined_events += 1
+                continue
+
+            self.event_batch.add(extracted_event_info)
+
+            # so the first refresh of this event can be a conditional request
+            self.http_cache.store(extracted_event_info.url, event_response)
+
+        # save the remainder so the next search page sees these urls as known
+        self.event_batch.flush()
 
     @abc.abstractmethod
-    def process_search_url(self, event_type_id, search_url, paginated_ind):
-        """ Processes a search url to extract all event/ticket info. """
-        known_urls     = self.get_known_urls()
-        search_results = fetch_url(search_url).text
-
-        self.extract_event_and_ticket_info(event_type_id, known_urls, search_results)
+    def process_search_url(self, event_type_id, search_url, paginated_ind, full_sweep):
+        """ 
+            Processes a search url to extract all event/ticket info, returning the number of
+            pages processed & new events found. Unless full_sweep, paging stops once
+            incremental_stop_pages pages in a row have had no new events.
+        """
+        subsequent_urls, page_new_events = self.process_counted_search_page(event_type_id, search_url,
+                                                                            paginated_ind)
+        num_pages                = 1
+        num_new_events           = page_new_events or 0
+        pages_without_new_events = 1 if page_new_events == 0 else 0
 
         if paginated_ind:
-            for subsequent_url in self.extract_subsequent_urls(search_results):
-                known_urls     = self.get_known_urls()
-                search_results = fetch_url(subsequent_url).text
-                self.extract_event_and_ticket_info(event_type_id, known_urls, search_results)
+            for subsequent_url in subsequent_urls:
+                if not full_sweep and self.incremental_stop_pages is not None and \
+                        pages_without_new_events >= self.incremental_stop_pages:
+                    logging.info("Stopped paging after " + str(pages_without_new_events) +
+                                 " pages without new events, " + str(num_pages) + " of " +
+                                 str(len(subsequent_urls) + 1) + " pages processed: " + search_url)
+                    crawlmetrics.pages.labels(self.vendor_id, "search", "not_paged").inc(
+                        len(subsequent_urls) + 1 - num_pages)
+                    break
+
+                page_new_events = self.process_counted_search_page(event_type_id, subsequent_url, False)[1]
+                num_pages      += 1
+                num_new_events += page_new_events or 0
+
+                # pages skipped as done before the cycle was resumed don't count either way
+                if page_new_events == 0:
+                    pages_without_new_events += 1
+                elif page_new_events is not None:
+                    pages_without_new_events = 0
+
+        return num_pages, num_new_events
 
     @abc.abstractmethod
     def run(self):
         """ Performs one crawl cycle. """
         logging.info("Commencing crawl cycle for vendor_id: " + str(self.vendor_id))
-        vendor_search_urls = self.get_vendor_search_urls()
 
-        for vendor_search_url in vendor_search_urls:
-            self.process_search_url(vendor_search_url.event_type_id, vendor_search_url.search_url,
-                                    vendor_search_url.paginated_ind)
+        with crawlmetrics.cycle_seconds.labels("crawler_" + str(self.vendor_id)).time():
+            with crawlmetrics.db_seconds.labels(self.vendor_id, "load_search_urls").time():
+                vendor_search_urls = self.get_vendor_search_urls()
+
+            with crawlmetrics.db_seconds.labels(self.vendor_id, "load_known_urls").time():
+                self.known_urls.load()
+
+            if self.frontier.start():
+                logging.info("Resuming unfinished crawl cycle, skipping the pages it had done.")
+
+            for vendor_search_url in vendor_search_urls:
+                full_sweep = self.is_full_sweep_due(vendor_search_url)
+                num_pages, num_new_events = self.process_search_url(vendor_search_url.event_type_id,
+                                                                    vendor_search_url.search_url,
+                                                                    vendor_search_url.paginated_ind, full_sweep)
+                self.save_listing_stats(vendor_search_url, num_pages, num_new_events, full_sweep)
+
+            self.known_urls.save()
+            self.frontier.finish()
+            vendor_search_urls = None
 
-        vendor_search_urls = None
         logging.info("Finished crawl cycle.")
         #enable for testing memory usage
         #h = hpy()
@@ -233,24 +340,285 @@ class ICrawler(object):
         return
     # END - ABSTRACT PROPERTIES REQUIRING VENDOR-SPECIFIC VALUES #
 
+    # START - PROPERTIES WITH DEFAULTS, OVERRIDE FOR VENDOR-SPECIFIC VALUES #
+    @property
+    def max_concurrent_fetches(self):
+        """ Max number of event pages fetched from this vendor at once. """
+        return 4
+
+    @property
+    def max_requests_per_sec(self):
+        """ 
+            Rate limit on requests to each of this vendor's hosts, shared by the crawler & the
+            refresher. Throttled below this while the vendor's slow or erroring, see RateLimiter.
+        """
+        return 4
+
+    @property
+    def refresh_requests_per_minute(self):
+        """ Budget of event pages refreshed from this vendor per minute. """
+        return 60
+
+    @property
+    def db_batch_size(self):
+        """ Max number of new events saved & committed together. """
+        return 100
+
+    @property
+    def incremental_stop_pages(self):
+        """ 
+            Paging through a listing stops after this many pages in a row without new events,
+            except in full sweeps. None to always page through whole listings.
+        """
+        return 3
+
+    @property
+    def full_sweep_sec(self):
+        """ How often each listing is paged through in full, however few new events it's been having. """
+        return 60*60*24
+
+    @property
+    def known_url_bloom_capacity(self):
+        """ 
+            If set, known urls are indexed with an on-disk bloom filter sized for this
+            many urls rather than an in-memory set of every url the vendor has had.
+        """
+        return None
+    # END - PROPERTIES WITH DEFAULTS, OVERRIDE FOR VENDOR-SPECIFIC VALUES #
+
     # START - HELPER METHODS #
     def load_tickets_for_event(self, event_info):
-        """ Given a EventInfo with a valid url, loads tickets for that event. """
-        event_page = self.fetch_event_url(event_info.url).text
-        self.extract_ticket_info(event_info, event_page)
+        """ 
+            Given a EventInfo with a valid url, loads tickets for that event. Returns the fetched
+            response, or None without loading anything if the page is unchanged since it was
+            last stored in the http cache.
+        """
+        event_response = self.fetch_if_changed(self.fetch_event_url, event_info.url, "event")
 
-    def get_known_urls(self):
-        """ Given a database connection, fetches known urls. """
-        known_urls = set()
+        if event_response is not None:
+            with crawlmetrics.parse_seconds.labels(self.vendor_id, "event").time():
+                self.extract_ticket_info(event_info, event_response.text)
 
-        with self.db_con.cursor() as cur1:
-            cur1.callproc("ozevnts.get_known_urls", ["known_urls_curname", self.vendor_id])
+        return event_response
 
-            with self.db_con.cursor("known_urls_curname") as cur2:
-                for record in cur2:
-                    known_urls.add(record[0])
+    def fetch_if_changed(self, fetch_func, url, page_type):
+        """ 
+            Conditionally fetches a url with fetch_func, returning None if the url
+            hasn't changed since it was last stored in the http cache.
+        """
+        response = fetch_func(url, headers=self.http_cache.conditional_headers(url))
+
+        if self.http_cache.is_unchanged(url, response):
+            crawlmetrics.pages.labels(self.vendor_id, page_type, "unchanged").inc()
+            logging.info("Unchanged since last processed: " + url)
+            return None
+
+        crawlmetrics.pages.labels(self.vendor_id, page_type, "changed").inc()
+        return response
+
+    def process_search_page(self, event_type_id, search_url, paginated_ind):
+        """ 
+            Extracts all event/ticket info from a single search results page, returning
+            its subsequent urls if paginated. Pages this crawl cycle already finished before
+            it was resumed are skipped, and a page which fails is quarantined (see CrawlFrontier)
+            rather than aborting the cycle.
+        """
+        if self.frontier.is_finished(search_url):
+            return self.cached_subsequent_urls(search_url)
+
+        if not self.frontier.attempt(search_url, crawlfrontier.SEARCH_PAGE):
+            return []
+
+        try:
+            subsequent_urls = self.crawl_search_page(event_type_id, search_url, paginated_ind)
+        except Exception, e:
+            # events batched from the page may be what failed to save
+            self.event_batch.discard()
+            self.quarantine_page(search_url, crawlfrontier.SEARCH_PAGE, "search", e)
+            return []
+
+        self.frontier.done(search_url, crawlfrontier.SEARCH_PAGE)
+        return subsequent_urls
+
+    def process_counted_search_page(self, event_type_id, search_url, paginated_ind):
+        """ 
+            process_search_page, also returning the number of new events found on the page,
+            or None if it was skipped as done before the crawl cycle was resumed.
+        """
+        if self.frontier.is_finished(search_url):
+            return self.process_search_page(event_type_id, search_url, paginated_ind), None
+
+        num_new_events_found = self.num_new_events_found
+        subsequent_urls      = self.process_search_page(event_type_id, search_url, paginated_ind)
+
+        return subsequent_urls, self.num_new_events_found - num_new_events_found
+
+    def crawl_search_page(self, event_type_id, search_url, paginated_ind):
+        """ Fetches & processes a search page for process_search_page, skipping parsing if it's unchanged. """
+        search_response = self.fetch_if_changed(self.http_client.get, search_url, "search")
+
+        if search_response is None:
+            return self.cached_subsequent_urls(search_url)
+
+        search_results         = search_response.text
+        subsequent_urls        = []
+        num_quarantined_events = self.num_quarantined_events
+
+        self.extract_event_and_ticket_info(event_type_id, self.known_urls, search_results)
+
+        if paginated_ind:
+            with crawlmetrics.parse_seconds.labels(self.vendor_id, "search").time():
+                subsequent_urls = self.extract_subsequent_urls(search_results)
+
+        # only stored once processed, so a failed page gets processed again next time. a page listing
+        # quarantined events is stored stale, so it's never found unchanged & skipped before they're
+        # out of quarantine and can be found again
+        self.http_cache.store(search_url, search_response, subsequent_urls,
+                              stale=self.num_quarantined_events > num_quarantined_events)
+
+        return subsequent_urls
+
+    def cached_subsequent_urls(self, search_url):
+        """ Subsequent urls of a search page as of when it was last processed. """
+        cache_entry = self.http_cache.load(search_url)
+
+        if cache_entry is None:
+            return []
+
+        return cache_entry["meta"] or []
+
+    def quarantine_page(self, url, url_type, page_type, page_error):
+        """ Quarantines a page which failed to be processed, so the crawl cycle can carry on without it. """
+        # any db error leaves the transaction aborted
+        self.db_con.rollback()
+        crawlmetrics.pages.labels(self.vendor_id, page_type, "quarantined").inc()
+        self.frontier.quarantine(url, url_type, repr(page_error))
+
+    def fetch_event_page(self, event_info):
+        """ 
+            Fetches the page for an EventInfo, called from fetch worker threads. Failures
+            are returned rather than raised, so one bad page doesn't end the other fetches.
+        """
+        event_response = None
+        page_error     = None
+
+        try:
+            event_response = self.fetch_event_url(event_info.url)
+            crawlmetrics.pages.labels(self.vendor_id, "event", "new").inc()
+        except Exception, e:
+            page_error = e
+
+        return event_info, event_response, page_error
+
+    def parse_event_page(self, event_info, event_response):
+        """ Extracts ticket info from a fetched event page, returning the error if it fails. """
+        try:
+            if self.parse_pool is not None:
+                # timed by the pool's worker
+                return self.parse_pool.parse_event_page(self, event_info, event_response)
+
+            with crawlmetrics.parse_seconds.labels(self.vendor_id, "event").time():
+                self.extract_ticket_info(event_info, event_response.text)
+        except Exception, e:
+            return e
+
+        return None
+
+    def process_event_pages(self, event_info_list):
+        """ 
+            Fetches & parses the pages of a list of EventInfos, yielding (event_info, event_response,
+            page_error) in order of completion. Pages are parsed on this thread as they're fetched,
+            unless the crawler's in a CrawlEngine, whose page_pipeline does both on shared workers,
+            or has a parse_pool, see parse_event_pages_in_pool.
+        """
+        if self.page_pipeline is not None:
+            for page_result in self.page_pipeline.process_event_pages(self, event_info_list):
+                yield page_result
+
+            return
+
+        if self.parse_pool is not None:
+            for page_result in self.parse_event_pages_in_pool(event_info_list):
+                yield page_result
+
+            return
+
+        for event_info, event_response, page_error in self.fetch_event_pages(event_info_list):
+            if page_error is None:
+                page_error = self.parse_event_page(event_info, event_response)
+
+            yield event_info, event_response, page_error
+
+    def parse_event_pages_in_pool(self, event_info_list):
+        """ 
+            process_event_pages with a parse_pool: pages are submitted to the pool as they're
+            fetched without waiting on them, so parsing runs on all the pool's worker processes
+            however many fetch threads there are. At most the pool's max_pending pages wait on
+            it at once, fetched pages being held back till it catches up. Parsed pages are
+            yielded in the order they were submitted, each given parse_timeout_sec from then.
+        """
+        pending_pages = collections.deque()
+
+        for event_info, event_response, page_error in self.fetch_event_pages(event_info_list):
+            if page_error is not None:
+                yield event_info, event_response, page_error
+                continue
+
+            pending_pages.append((event_info, event_response, self.parse_pool.submit_event_page(event_info,
+                                                                                               event_response),
+                                  time.time() + self.parse_pool.parse_timeout_sec))
+
+            while pending_pages and (len(pending_pages) >= self.parse_pool.max_pending or
+                                     pending_pages[0][2].ready()):
+                yield self.pool_page_result(pending_pages.popleft())
+
+        while pending_pages:
+            yield self.pool_page_result(pending_pages.popleft())
+
+    def pool_page_result(self, pending_page):
+        """ Waits for a page submitted to the parse_pool, returning (event_info, event_response, page_error). """
+        event_info, event_response, async_result, deadline = pending_page
+
+        return event_info, event_response, self.parse_pool.event_page_error(self, event_info, async_result,
+                                                                             max(0, deadline - time.time()))
+
+    def fetch_event_pages(self, event_info_list):
+        """ 
+            Fetches pages for a list of EventInfos concurrently, at most max_concurrent_fetches
+            at a time, yielding (event_info, event_response, page_error) in order of completion.
+        """
+        if not event_info_list:
+            return
+
+        fetch_pool = ThreadPool(min(self.max_concurrent_fetches, len(event_info_list)))
+
+        try:
+            for fetch_result in fetch_pool.imap_unordered(self.fetch_event_page, event_info_list):
+                yield fetch_result
+        finally:
+            fetch_pool.terminate()
+
+    def create_known_url_index(self):
+        """ Creates the index of known urls for this vendor, loaded at the start of each crawl cycle. """
+        if self.known_url_bloom_capacity is None:
+            return knownurls.KnownUrlIndex(self.db_con, self.vendor_id)
+        else:
+            return knownurls.BloomKnownUrlIndex(self.db_con, self.vendor_id, self.known_url_bloom_capacity)
+
+    def is_full_sweep_due(self, vendor_search_url):
+        return vendor_search_url.full_sweep_age_sec is None or \
+            vendor_search_url.full_sweep_age_sec >= self.full_sweep_sec
+
+    def save_listing_stats(self, vendor_search_url, num_pages, num_new_events, full_sweep):
+        """ Records how a listing's crawl went, including when it was last swept in full. """
+        with self.db_con.cursor() as cur1:
+            cur1.callproc("ozevnts.save_listing_stats",
+                          [self.vendor_id, vendor_search_url.event_type_id, vendor_search_url.search_url, num_pages,
+                           num_new_events, full_sweep])
 
-        return known_urls
+        self.db_con.commit()
+        logging.info("Listing crawled, " + str(num_pages) + " pages & " + str(num_new_events) +
+                     " new events: " + vendor_search_url.search_url)
 
     def get_vendor_search_urls(self):
         """ Given a database connection, fetches vendor search urls. """
@@ -262,7 +630,8 @@ class ICrawler(object):
             with self.db_con.cursor("search_urls_curname") as cur2:
                 for record in cur2:
                     #print record
-                    vendor_search_urls.append(VendorSearchListing(record[0], record[1], record[2], record[3]))
+                    vendor_search_urls.append(VendorSearchListing(record[0], record[1], record[2], record[3],
+                                                                  record[4]))
 
         return vendor_search_urls
     # END - HELPER METHODS #
@@ -1,9 +1,14 @@
 import decimal
 import logging
-from bs4 import BeautifulSoup
 from datetime import datetime
 
 import libcrawler
+import parsing
+
+# only the subtrees extract_ticket_info & extract_subsequent_urls read
+event_page_strainer = parsing.SoupStrainer(id=["event-summary-block", "event-tickettypetable"])
+pagination_strainer = parsing.SoupStrainer(
+    lambda name, attrs: name == "section" and parsing.has_class(attrs, "pagination"))
 
 
 class MoshtixCrawler(libcrawler.ICrawler):
@@ -39,7 +44,7 @@ class MoshtixCrawler(libcrawler.ICrawler):
         logging.info("Now processing: " + event_info.url)
 
         # find <div> with id = "event-summary-block"
-        soup = BeautifulSoup(event_page)
+        soup = parsing.make_soup(event_page, event_page_strainer)
         event_summary_div_tag = soup.find("div", id="event-summary-block")
 
         if event_summary_div_tag is not None:
@@ -113,7 +118,7 @@ class MoshtixCrawler(libcrawler.ICrawler):
 
     def extract_subsequent_urls(self, search_results):
         subsequent_urls     = []
-        search_results_soup = BeautifulSoup(search_results)
+        search_results_soup = parsing.make_soup(search_results, pagination_strainer)
         pagination_tag      = search_results_soup.find("section", class_="pagination")
 
         if pagination_tag is not None:
@@ -128,7 +133,7 @@ class MoshtixCrawler(libcrawler.ICrawler):
 
     def extract_new_events(self, event_type_id, known_urls, search_results):
         event_list             = []
-        search_results_soup    = BeautifulSoup(search_results)
+        search_results_soup    = parsing.make_soup(search_results)
         search_result_div_tags = search_results_soup.find_all("div", {"class": "searchresult_content"})
 
         if search_result_div_tags is not None and len(search_result_div_tags) > 0:
@@ -150,14 +155,14 @@ class MoshtixCrawler(libcrawler.ICrawler):
 
         return event_list
 
-    def fetch_event_url(self, url):
-        return super(MoshtixCrawler, self).fetch_event_url(url)
+    def fetch_event_url(self, url, **kwargs):
+        return super(MoshtixCrawler, self).fetch_event_url(url, **kwargs)
 
     def extract_event_and_ticket_info(self, event_type_id, known_urls, search_results):
         super(MoshtixCrawler, self).extract_event_and_ticket_info(event_type_id, known_urls, search_results)
 
-    def process_search_url(self, event_type_id, search_url, paginated_ind):
-        super(MoshtixCrawler, self).process_search_url(event_type_id, search_url, paginated_ind)
+    def process_search_url(self, event_type_id, search_url, paginated_ind, full_sweep):
+        return super(MoshtixCrawler, self).process_search_url(event_type_id, search_url, paginated_ind, full_sweep)
 
     def run(self):
         super(MoshtixCrawler, self).run()
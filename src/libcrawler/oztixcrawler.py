@@ -1,14 +1,30 @@
 import decimal
-import requests
-import time
 import logging
-from bs4 import BeautifulSoup
+import threading
 from datetime import datetime
 
 import libcrawler
+import parsing
+
+
+def is_event_page_tag(name, attrs):
+    """ Only the subtrees extract_ticket_info reads: venue info & the ticket table. """
+    return (name == "div" and parsing.has_class(attrs, "venueInfo")) or (
+        name == "table" and attrs.get("tsclass") == "ReserveTable")
+
+event_page_strainer = parsing.SoupStrainer(is_event_page_tag)
 
 
 class OztixCrawler(libcrawler.ICrawler):
+    # session cookie set by oztix's cookie check, which requests without it are redirected through
+    session_cookie_name = "ASP.NET_SessionId"
+
+    def __init__(self, db_con):
+        super(OztixCrawler, self).__init__(db_con)
+
+        # fetch threads share the session, only one of them renews its cookie at a time
+        self.session_lock = threading.Lock()
+
     def create_datetime_from_oztix_event_date_str(self, datetime_str):
         """ 
             extracts starting datetime from formats like "Tuesday 31 December 2013  (opening 8:00pm)"
@@ -71,7 +87,7 @@ class OztixCrawler(libcrawler.ICrawler):
         logging.info("Now processing: " + event_info.url)
 
         # find <div> with id = "venueInfo"
-        soup = BeautifulSoup(event_page)
+        soup = parsing.make_soup(event_page, event_page_strainer)
         event_summary_div_tag = soup.find("div", class_="venueInfo")
 
         if event_summary_div_tag:
@@ -80,6 +96,10 @@ class OztixCrawler(libcrawler.ICrawler):
             div_venue_tag = event_summary_div_tag.find(
                 "div", id="ctl00_ContentPlaceHolder1_WucShowsMain1_WucEventsDetail1_pnl_venue")
 
+            # the venue's name & address can be in separate nested tags, so keep their text apart
+            if div_venue_tag is not None:
+                event_info.venue_name = div_venue_tag.get_text(" ", strip=True)
+
             if div_venue_tag is not None and div_venue_tag.previous_sibling is not None and (
                     div_venue_tag.previous_sibling.previous_sibling is not None):
                 event_info.event_datetime = self.create_datetime_from_oztix_event_date_str(
@@ -142,7 +162,7 @@ class OztixCrawler(libcrawler.ICrawler):
 
     def extract_new_events(self, event_type_id, known_urls, search_results):
         event_list            = []
-        search_results_soup   = BeautifulSoup(search_results)
+        search_results_soup   = parsing.make_soup(search_results)
         state_header_div_tags = search_results_soup.find_all("div", class_="state_header")
 
         if state_header_div_tags is not None and len(state_header_div_tags) > 0:
@@ -198,27 +218,47 @@ class OztixCrawler(libcrawler.ICrawler):
 
         return event_list
 
-    def fetch_event_url(self, url):
-        fetched = False
-        output  = False
+    def session_cookie(self):
+        """ The session's oztix session cookie, None if it has none. """
+        for cookie in self.http_client.session.cookies:
+            if cookie.name == OztixCrawler.session_cookie_name:
+                return cookie.value
+
+        return None
+
+    def renew_session_cookie(self, url, stale_cookie):
+        """ 
+            Goes through the cookie check to get a new session cookie in place of stale_cookie,
+            unless another fetch thread already has.
+        """
+        with self.session_lock:
+            if self.session_cookie() == stale_cookie:
+                logging.info("Renewing oztix session cookie via: " + url)
+                self.http_client.get(url, allow_redirects=False)
+
+    def fetch_event_url(self, url, **kwargs):
+        # oztix sends requests without its session cookie through a redirecting cookie check,
+        # so do the check to fill the session's cookie jar and reuse the cookie after that
+        session_cookie = self.session_cookie()
+
+        if session_cookie is None:
+            self.renew_session_cookie(url, None)
+            session_cookie = self.session_cookie()
+
+        response = self.http_client.get(url, **kwargs)
 
-        while not fetched:
-            try:
-                r1      = requests.get(url, allow_redirects=False, headers={"User-Agent": "Mozilla/5.0"})
-                output  = requests.get(url, cookies=r1.cookies,    headers={"User-Agent": "Mozilla/5.0"})
-                fetched = True
-            except requests.Timeout, e:
-                #timeout, wait 30 seconds and try again
-                logging.debug("Received timeout, retrying in 30 seconds...")
-                time.sleep(30)
+        # redirected through the cookie check again, so the cookie's expired
+        if any(redirect_response.is_redirect for redirect_response in response.history):
+            self.renew_session_cookie(url, session_cookie)
+            response = self.http_client.get(url, **kwargs)
 
-        return output
+        return response
 
     def extract_event_and_ticket_info(self, event_type_id, known_urls, search_results):
         super(OztixCrawler, self).extract_event_and_ticket_info(event_type_id, known_urls, search_results)
 
-    def process_search_url(self, event_type_id, search_url, paginated_ind):
-        super(OztixCrawler, self).process_search_url(event_type_id, search_url, paginated_ind)
+    def process_search_url(self, event_type_id, search_url, paginated_ind, full_sweep):
+        return super(OztixCrawler, self).process_search_url(event_type_id, search_url, paginated_ind, full_sweep)
 
     def run(self):
         super(OztixCrawler, self).run()
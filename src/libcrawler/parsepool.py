@@ -0,0 +1,154 @@
+import time
+import signal
+import multiprocessing
+from requests.compat import chardet
+
+import libcrawler
+import crawlerfactory
+import crawlmetrics
+
+"""
+    Pool of worker processes which parse vendor pages with the vendor crawlers' own
+    extract_ticket_info/extract_new_events, so parsing (pure python BeautifulSoup work)
+    can use every core rather than the crawling process' one. Raw page bytes go out &
+    compact event/ticket records come back, keeping what's pickled between processes small.
+"""
+
+# each worker process' own crawlers, only ever used for parsing
+worker_crawler_fact = None
+
+
+def init_worker():
+    global worker_crawler_fact
+
+    # interrupts are for the parent process to handle, which then terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_crawler_fact = crawlerfactory.CrawlerFactory(None)
+
+
+def decode_page(page_bytes, encoding):
+    """ A page's text, decoded as requests' Response.text would. """
+    if encoding is None:
+        encoding = chardet.detect(page_bytes)["encoding"]
+
+    try:
+        return unicode(page_bytes, encoding or "utf-8", errors="replace")
+    except (LookupError, TypeError):
+        return unicode(page_bytes, errors="replace")
+
+
+def event_record(event_info):
+    return (event_info.vendor_id, event_info.event_type_id, event_info.event_name, event_info.url,
+            event_info.venue_name, event_info.venue_state, event_info.event_datetime, event_info.invalid)
+
+
+def event_from_record(record):
+    event_info = libcrawler.EventInfo(record[0], record[1], record[2], record[3])
+    event_info.venue_name     = record[4]
+    event_info.venue_state    = record[5]
+    event_info.event_datetime = record[6]
+    event_info.invalid        = record[7]
+
+    return event_info
+
+
+def parse_event_page(record, page_bytes, encoding):
+    """ 
+        Runs in a worker process, returning (event record, ticket records, parse sec, error) of the
+        parsed page. Errors are returned rather than raised, as pools only call back on success.
+    """
+    event_info = event_from_record(record)
+    crawler    = worker_crawler_fact.get_crawler(event_info.vendor_id)
+    start_time = time.time()
+
+    try:
+        crawler.extract_ticket_info(event_info, decode_page(page_bytes, encoding))
+    except Exception, e:
+        # exceptions aren't all picklable, so only their description is sent back
+        return None, None, time.time() - start_time, e.__class__.__name__ + ": " + str(e)
+
+    return event_record(event_info), [(ticket_info.ticket_num, ticket_info.ticket_type, ticket_info.ticket_price,
+                                       ticket_info.booking_fee, ticket_info.sold_out)
+                                      for ticket_info in event_info.ticket_list], time.time() - start_time, None
+
+
+def parse_search_page(vendor_id, event_type_id, search_results):
+    """ Runs in a worker process, returning event records of every event in the search results. """
+    try:
+        event_info_list = worker_crawler_fact.get_crawler(vendor_id).extract_new_events(event_type_id, (),
+                                                                                       search_results)
+    except Exception, e:
+        # exceptions aren't all picklable, so only their description is sent back
+        raise Exception(e.__class__.__name__ + ": " + str(e))
+
+    return [event_record(event_info) for event_info in event_info_list]
+
+
+class ParsePool(object):
+    """
+        Parses pages for crawlers in num_workers worker processes, one per core by default.
+        Event pages are submitted asynchronously (see ICrawler.process_event_pages), up to
+        max_pending at a time, so every worker is kept busy however many threads fetch them.
+        Parse times are measured in the workers & recorded against the crawler's vendor.
+        Results are waited on for at most parse_timeout_sec, as a task whose worker died
+        (eg. killed for its memory use) is never completed.
+    """
+
+    def __init__(self, num_workers=None, parse_timeout_sec=120):
+        self.num_workers       = num_workers or multiprocessing.cpu_count()
+        self.max_pending       = self.num_workers * 2
+        self.parse_timeout_sec = parse_timeout_sec
+        self.pool              = multiprocessing.Pool(self.num_workers, init_worker)
+
+    def apply_event_page_result(self, crawler, event_info, page_result):
+        """ Applies a parse_event_page result to the EventInfo, returning the error if parsing failed. """
+        record, ticket_records, parse_sec, error_msg = page_result
+        crawlmetrics.parse_seconds.labels(crawler.vendor_id, "event").observe(parse_sec)
+
+        if error_msg is not None:
+            return Exception(error_msg)
+
+        parsed_event_info = event_from_record(record)
+
+        event_info.venue_name     = parsed_event_info.venue_name
+        event_info.venue_state    = parsed_event_info.venue_state
+        event_info.event_datetime = parsed_event_info.event_datetime
+        event_info.invalid        = parsed_event_info.invalid
+        event_info.ticket_list    = [libcrawler.TicketInfo(*ticket_record) for ticket_record in ticket_records]
+
+        return None
+
+    def parse_event_page(self, crawler, event_info, event_response):
+        """ As crawler.parse_event_page, waiting for a worker to parse the page. """
+        return self.event_page_error(crawler, event_info, self.submit_event_page(event_info, event_response))
+
+    def submit_event_page(self, event_info, event_response):
+        """ Submits a fetched event page to be parsed without waiting for it, returning its AsyncResult. """
+        return self.pool.apply_async(parse_event_page, (event_record(event_info), event_response.content,
+                                                        event_response.encoding))
+
+    def event_page_error(self, crawler, event_info, async_result, timeout_sec=None):
+        """ 
+            Waits up to timeout_sec (parse_timeout_sec by default) for a submitted event page to be
+            parsed & applies the result to the EventInfo, returning the page's error if there was one.
+            A lost or failed task is an error like any other, so its page is quarantined.
+        """
+        try:
+            return self.apply_event_page_result(crawler, event_info, async_result.get(
+                self.parse_timeout_sec if timeout_sec is None else timeout_sec))
+        except multiprocessing.TimeoutError:
+            return Exception("Timed out parsing event page after " + str(self.parse_timeout_sec) + " sec")
+        except Exception, e:
+            return e
+
+    def extract_new_events(self, crawler, event_type_id, known_urls, search_results):
+        """ As crawler.extract_new_events, known urls being filtered out here rather than by the worker. """
+        records = self.pool.apply_async(parse_search_page, (crawler.vendor_id, event_type_id,
+                                                            search_results)).get(self.parse_timeout_sec)
+
+        return [event_from_record(record) for record in records if record[3] not in known_urls]
+
+    def close(self):
+        """ Stops the worker processes, any parsing still going being abandoned. """
+        self.pool.terminate()
+        self.pool.join()
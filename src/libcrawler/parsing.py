@@ -0,0 +1,34 @@
+"""
+    Parsing layer used by all crawlers. Pages are parsed with lxml when it's
+    installed (falling back to python's html.parser), and crawlers which only
+    need a few subtrees of a page pass a SoupStrainer so nothing else is built.
+"""
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml
+    parser_name = "lxml"
+except ImportError:
+    parser_name = "html.parser"
+
+# set False to always build the full tree, eg. for comparison in benchmarks
+partial_parsing = True
+
+
+def make_soup(markup, parse_only=None):
+    """ Parses markup, only keeping the subtrees matched by parse_only if given. """
+    if not partial_parsing:
+        parse_only = None
+
+    return BeautifulSoup(markup, parser_name, parse_only=parse_only)
+
+
+def has_class(attrs, class_name):
+    """ Checks tag attrs for a class, whether still a raw string (while parsing) or already split into a list. """
+    classes = attrs.get("class") or []
+
+    if isinstance(classes, basestring):
+        classes = classes.split()
+
+    return class_name in classes
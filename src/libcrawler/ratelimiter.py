@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import fcntl
+import urlparse
+
+import crawlmetrics
+import cachedirs
+
+
+def url_host(url):
+    return urlparse.urlparse(url).netloc or "default"
+
+
+class RateLimiter(object):
+    """
+        Token bucket rate limit per host, shared by every process requesting from the host
+        (ie. a vendor's crawler & the refresher) through a small flock'd state file per host.
+        The rate adapts to how the host is coping: it's cut on 429s, 5xxs, timeouts & slow
+        responses, honouring any Retry-After, then recovers a step per healthy response.
+    """
+
+    min_rate_factor   = 0.05
+    recovery_step     = 0.02
+    throttle_statuses = {429: 0.5, 503: 0.5}
+    error_factor      = 0.75
+    slow_factor       = 0.9
+
+    def __init__(self, requests_per_sec, burst, slow_response_sec=5, state_dir=None):
+        self.requests_per_sec  = float(requests_per_sec)
+        self.burst             = burst
+        self.slow_response_sec = slow_response_sec
+        self.state_dir         = state_dir or cachedirs.cache_dir("ratelimit")
+        self.state_dir_made    = False
+
+    def update_state(self, url, update_func):
+        """
+            Calls update_func(state, time_now) with the host's state under its file lock,
+            saving any changes it makes, and returns what it returns.
+        """
+        host       = url_host(url)
+        state_path = os.path.join(self.state_dir, host.replace(":", "_") + ".json")
+
+        if not self.state_dir_made:
+            cachedirs.make_dirs(self.state_dir)
+            self.state_dir_made = True
+
+        state_fd = os.open(state_path, os.O_RDWR | os.O_CREAT, 0644)
+
+        try:
+            fcntl.flock(state_fd, fcntl.LOCK_EX)
+
+            with os.fdopen(os.dup(state_fd), "r+") as state_file:
+                try:
+                    state = json.load(state_file)
+                except ValueError:
+                    # new, or left half written by a killed process
+                    state = {"tokens": self.burst, "refill_time": time.time(), "rate_factor": 1.0,
+                             "blocked_until": 0}
+
+                time_now = time.time()
+                rate     = self.requests_per_sec * state["rate_factor"]
+
+                state["tokens"]      = min(self.burst, state["tokens"] + (time_now - state["refill_time"]) * rate)
+                state["refill_time"] = time_now
+                result               = update_func(state, time_now)
+
+                state_file.seek(0)
+                state_file.truncate()
+                json.dump(state, state_file)
+
+            crawlmetrics.rate_limit_factor.labels(host).set(state["rate_factor"])
+            return result
+        finally:
+            os.close(state_fd)
+
+    def token_wait_sec(self, state, time_now):
+        if state["blocked_until"] > time_now:
+            return state["blocked_until"] - time_now
+
+        return max(0, (1 - state["tokens"]) / (self.requests_per_sec * state["rate_factor"]))
+
+    def wait_sec(self, url):
+        """ How long until a request to url's host would be allowed, without taking a token. """
+        return self.update_state(url, self.token_wait_sec)
+
+    def acquire(self, url):
+        """ Waits until a request to url's host is allowed, taking a token for it. """
+        def take_token(state, time_now):
+            wait_sec = self.token_wait_sec(state, time_now)
+
+            if wait_sec == 0:
+                state["tokens"] -= 1
+
+            return wait_sec
+
+        start_time = time.time()
+
+        while True:
+            wait_sec = self.update_state(url, take_token)
+
+            if wait_sec == 0:
+                break
+
+            time.sleep(wait_sec)
+
+        crawlmetrics.rate_limit_wait_seconds.labels(url_host(url)).observe(time.time() - start_time)
+
+    def record_response(self, url, status_code, response_sec, retry_after=None):
+        """
+            Adapts the host's rate to a response's status & latency, status_code being None
+            for requests which timed out or couldn't connect.
+        """
+        def adapt_rate(state, time_now):
+            if status_code in RateLimiter.throttle_statuses:
+                rate_factor = state["rate_factor"] * RateLimiter.throttle_statuses[status_code]
+            elif status_code is None or status_code >= 500:
+                rate_factor = state["rate_factor"] * RateLimiter.error_factor
+            elif response_sec > self.slow_response_sec:
+                rate_factor = state["rate_factor"] * RateLimiter.slow_factor
+            else:
+                rate_factor = state["rate_factor"] + RateLimiter.recovery_step
+
+            state["rate_factor"] = max(RateLimiter.min_rate_factor, min(1.0, rate_factor))
+
+            if retry_after is not None:
+                state["blocked_until"] = max(state["blocked_until"], time_now + retry_after)
+
+        self.update_state(url, adapt_rate)
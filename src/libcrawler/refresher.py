@@ -1,116 +1,329 @@
-import gc
+import time
+import heapq
 import logging
+import collections
 import psycopg2
 import libcrawler
 import crawlerfactory
+import crawlmetrics
+import crawlfrontier
 from util import dbconnector
 
 #enable for testing memory usage
 #from guppy import hpy
 
+# how far ahead each refresh cycle schedules refreshes, cycles should follow each other
+# closely (see workscheduler) so events are refreshed as they fall due
+refresh_horizon_sec = 60*5
 
-def load_events_to_refresh(db_con):
-    """ Loads events to refresh. """
-    event_info_list = []
-    current_event   = None
+# events due a refresh are read from the db this many at a time
+refresh_fetch_size = 500
 
-    with db_con.cursor() as cur1:
-        cur1.callproc("ozevnts.get_tickets_to_refresh", ["events_refresh_curname"])
+# max events read ahead of the ones being refreshed (bar any held back by their vendor's budget)
+refresh_lookahead = 1000
+
+
+class RefreshQueue(object):
+    """ 
+        Priority queue of events to refresh, keyed by when each is next due. Events are
+        only popped once due, and only within their vendor's refresh request budget.
+        Events are pulled in from event_iter (soonest due first) as they're needed, so
+        only a window of refresh_lookahead events is held at once.
+    """
+
+    def __init__(self, crawler_fact, event_iter):
+        self.crawler_fact  = crawler_fact
+        self.event_iter    = event_iter
+        self.heap          = []
+        self.request_times = collections.defaultdict(collections.deque)
+        self.last_due_time = None
+        self.num_loaded    = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, due_time, event_info):
+        heapq.heappush(self.heap, (due_time, event_info.vendor_event_id, event_info))
+
+    def top_up(self):
+        """ 
+            Reads events in up to the lookahead, and beyond it while the events held
+            back by vendor budgets aren't due before the next unread event could be.
+        """
+        while self.event_iter is not None and (
+                len(self.heap) < refresh_lookahead or self.heap[0][0] > self.last_due_time):
+            next_event = next(self.event_iter, None)
+
+            if next_event is None:
+                self.event_iter = None
+            else:
+                self.last_due_time = next_event[0]
+                self.num_loaded   += 1
+                self.push(*next_event)
+
+    def is_exhausted(self):
+        """ True if every event to refresh has been read in. """
+        return self.event_iter is None
+
+    def sec_until_next_due(self):
+        self.top_up()
+
+        if not self.heap:
+            return None
+
+        return max(0, self.heap[0][0] - time.time())
+
+    def budget_free_time(self, event_info, time_now):
+        """ 
+            Time a request for event_info is next within its vendor's per minute budget,
+            and within the rate limit its host shares with the vendor's crawler.
+        """
+        crawler       = self.crawler_fact.get_crawler(event_info.vendor_id)
+        request_times = self.request_times[event_info.vendor_id]
+
+        while request_times and request_times[0] <= time_now - 60:
+            request_times.popleft()
+
+        if len(request_times) < crawler.refresh_requests_per_minute:
+            return time_now + crawler.rate_limiter.wait_sec(event_info.url)
+
+        return request_times[0] + 60
+
+    def pop_due(self, until_time):
+        """ 
+            Waits for the next event to become due & be within its vendor's budget, returning
+            it, or None if there are no more events which can be refreshed before until_time.
+        """
+        self.top_up()
+
+        while self.heap:
+            due_time, vendor_event_id, event_info = self.heap[0]
+            time_now = time.time()
+
+            if due_time >= until_time:
+                return None
+            elif due_time > time_now:
+                time.sleep(due_time - time_now)
+                continue
+
+            heapq.heappop(self.heap)
+            budget_free_time = self.budget_free_time(event_info, time_now)
+
+            if budget_free_time > time_now:
+                # vendor's budget used up or host throttled, try again once it frees up
+                heapq.heappush(self.heap, (budget_free_time, vendor_event_id, event_info))
+                self.top_up()
+            else:
+                self.request_times[event_info.vendor_id].append(time_now)
+                return event_info
+
+        return None
+
+
+def iter_events_to_refresh(read_con):
+    """ 
+        Yields (due time, event) of events due a refresh within refresh_horizon_sec, soonest
+        due first, reading refresh_fetch_size rows at a time from the stored proc's cursor.
+        read_con's transaction is held open while iterating so it mustn't be used for writes.
+    """
+    current_event = None
+    due_time      = None
+    load_time     = time.time()
+
+    with read_con.cursor() as cur1:
+        cur1.callproc("ozevnts.get_tickets_to_refresh",
+                      ["events_refresh_curname", str(refresh_horizon_sec) + " seconds"])
+
+        with read_con.cursor("events_refresh_curname") as cur2:
+            cur2.itersize = refresh_fetch_size
 
-        with db_con.cursor("events_refresh_curname") as cur2:
             for record in cur2:
                 new_ticket = libcrawler.TicketInfo(record[4], record[5], record[6], record[7], record[8])
 
                 # first event or new event?
                 if current_event is None or current_event.vendor_event_id != record[0]:
                     if current_event is not None:
-                        event_info_list.append(current_event)
+                        yield due_time, current_event
 
                     current_event = libcrawler.EventInfo(record[1], None, None, record[3])
-                    current_event.vendor_event_id = record[0]
-                    current_event.event_datetime  = record[2]
+                    current_event.vendor_event_id  = record[0]
+                    current_event.event_datetime   = record[2]
+                    current_event.refresh_failures = record[10]
+                    due_time = load_time + float(record[9])
 
                 current_event.ticket_list.append(new_ticket)
 
             # save last event too
             if current_event is not None:
-                event_info_list.append(current_event)
+                yield due_time, current_event
 
-    return event_info_list
+    read_con.commit()
 
 
-def refresh_events(db_con, crawler_fact, events_to_refresh):
-    event_ids_to_mark_refreshed = []
+# max number of a vendor's refreshed events applied & committed together
+refresh_batch_size = 50
+
+
+class RefreshBatch(object):
+    """ 
+        Accumulates a vendor's refreshed events so all of their ticket changes are applied
+        server-side by one ozevnts.apply_refreshed_tickets call & commit per batch.
+        Batches are per vendor so db time & ticket changes are recorded per vendor.
+    """
+
+    def __init__(self, db_con, vendor_id, batch_size):
+        self.db_con        = db_con
+        self.vendor_id     = vendor_id
+        self.batch_size    = batch_size
+        self.event_cols    = ([], [])
+        self.ticket_cols   = ([], [], [], [], [], [])
+        self.cache_entries = []
+
+    def add(self, vendor_event_id, match_ind, ticket_list, http_cache=None, url=None, response=None):
+        """ 
+            Adds an event's refreshed tickets to the batch, see apply_refreshed_tickets for
+            match_ind values. A given response is stored in http_cache once committed.
+        """
+        self.event_cols[0].append(vendor_event_id)
+        self.event_cols[1].append(match_ind)
+
+        for ticket_info in ticket_list:
+            self.ticket_cols[0].append(vendor_event_id)
+            self.ticket_cols[1].append(ticket_info.ticket_num)
+            self.ticket_cols[2].append(ticket_info.ticket_type)
+            self.ticket_cols[3].append(ticket_info.ticket_price)
+            self.ticket_cols[4].append(ticket_info.booking_fee)
+            self.ticket_cols[5].append(ticket_info.sold_out_db_val())
+
+        if response is not None:
+            self.cache_entries.append((http_cache, url, response))
+
+        if len(self.event_cols[0]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Applies all batched tickets & marks their events refreshed, then commits. """
+        if not self.event_cols[0]:
+            return
+
+        with crawlmetrics.db_seconds.labels(self.vendor_id, "apply_refreshed_tickets").time():
+            with self.db_con.cursor() as cur1:
+                # explicit casts as psycopg2 can't type arrays which are empty or all nulls
+                cur1.execute("select ozevnts.apply_refreshed_tickets(%s::integer[], %s::text[], %s::integer[], "
+                             "%s::integer[], %s::text[], %s::numeric[], %s::numeric[], %s::text[])",
+                             self.event_cols + self.ticket_cols)
+                num_changed_tickets = cur1.fetchone()[0]
+
+            self.db_con.commit()
+
+        crawlmetrics.updated_tickets.labels(self.vendor_id).inc(num_changed_tickets)
+
+        # only cached once saved, so a failed batch isn't treated as unchanged next time
+        for http_cache, url, response in self.cache_entries:
+            http_cache.store(url, response)
+
+        logging.info("Applied refreshed tickets for " + str(len(self.event_cols[0])) + " events of vendor_id: " +
+                     str(self.vendor_id) + ", " + str(num_changed_tickets) + " tickets changed.")
+        self.event_cols    = ([], [])
+        self.ticket_cols   = ([], [], [], [], [], [])
+        self.cache_entries = []
+
+
+def refresh_events(db_con, crawler_fact, refresh_queue, until_time):
+    """ Refreshes events from the refresh queue as they fall due, up until until_time. """
+    refresh_batches = {}
+    num_refreshed   = 0
+
+    while True:
+        # save what's been refreshed so far rather than holding it while waiting
+        sec_until_next_due = refresh_queue.sec_until_next_due()
+        if sec_until_next_due is None or sec_until_next_due > 0:
+            for refresh_batch in refresh_batches.values():
+                refresh_batch.flush()
+
+        event_to_refresh = refresh_queue.pop_due(until_time)
+        if event_to_refresh is None:
+            break
 
-    while events_to_refresh:
-        event_to_refresh  = events_to_refresh.pop()
         latest_event_data = libcrawler.EventInfo(event_to_refresh.vendor_id, event_to_refresh.event_type_id,
                                                  event_to_refresh.event_name, event_to_refresh.url)
         latest_event_data.vendor_event_id = event_to_refresh.vendor_event_id
         crawler = crawler_fact.get_crawler(event_to_refresh.vendor_id)
-        crawler.load_tickets_for_event(latest_event_data)
+
+        if crawler.vendor_id not in refresh_batches:
+            refresh_batches[crawler.vendor_id] = RefreshBatch(db_con, crawler.vendor_id, refresh_batch_size)
+
+        refresh_batch = refresh_batches[crawler.vendor_id]
+
+        try:
+            event_response = crawler.load_tickets_for_event(latest_event_data)
+        except Exception, e:
+            # marked refreshed so it backs off till it's next due rather than failing every cycle,
+            # and quarantined if it keeps failing (see CrawlFrontier.fail)
+            logging.exception("Failed to refresh event: " + latest_event_data.url)
+            refresh_batch.add(latest_event_data.vendor_event_id, None, [])
+            crawler.frontier.fail(latest_event_data.url, crawlfrontier.EVENT_PAGE, repr(e),
+                                  event_to_refresh.refresh_failures)
+            crawlmetrics.refreshed_events.labels(crawler.vendor_id, "failed").inc()
+            continue
 
         existing_num_tickets = len(event_to_refresh.ticket_list)
         new_num_tickets      = len(latest_event_data.ticket_list)
 
-        # don't do this anymore, leave the event as is if marked invalid
-        #if latest_event_data.invalid:
-        #    latest_event_data.invalidate_event(db_con)
-        #    db_con.commit()
-        if not latest_event_data.invalid:
-            # same number or more ticket types? only update any changes to existing tickets
-            if existing_num_tickets == new_num_tickets or new_num_tickets > existing_num_tickets:
-                for idx, existing_ticket in enumerate(event_to_refresh.ticket_list):
-                    if latest_event_data.ticket_list[idx].has_been_updated(existing_ticket):
-                        latest_event_data.ticket_list[idx].update(db_con, latest_event_data.vendor_event_id)
-                        db_con.commit()
-
-            # if there were more tickets types, now insert the new ones
-            if new_num_tickets > existing_num_tickets:
-                for idx in range(existing_num_tickets, new_num_tickets):
-                    latest_event_data.ticket_list[idx].create(db_con, latest_event_data.vendor_event_id)
-                    db_con.commit()
+        if event_response is None:
+            # page unchanged since its tickets were last saved, only mark it refreshed
+            refresh_batch.add(latest_event_data.vendor_event_id, None, [])
+            refresh_result = "unchanged"
+        elif latest_event_data.invalid:
+            # tickets left as they are, but marked refreshed so it's not fetched again till next due
+            refresh_batch.add(latest_event_data.vendor_event_id, None, [])
+            refresh_result = "invalid"
+        else:
+            # same number or more ticket types? update any changes to existing tickets & insert new ones
+            if new_num_tickets >= existing_num_tickets:
+                match_ind = "N"
             # less ticket types? mark any non-existent ones as sold out, unless its ticket master
             # who sometimes shows tickets not available on their website for a period of time
-            elif new_num_tickets < existing_num_tickets and crawler.vendor_id != 3:
-                for existing_ticket in event_to_refresh.ticket_list:
-                    if not existing_ticket.sold_out:
-                        found_ticket = None
-
-                        for new_ticket in latest_event_data.ticket_list:
-                            if new_ticket.ticket_type == existing_ticket.ticket_type:
-                                found_ticket = new_ticket
-                                break
+            elif crawler.vendor_id != 3:
+                match_ind = "T"
+            else:
+                match_ind = None
 
-                        if found_ticket is None:
-                            existing_ticket.sold_out = True
-                            existing_ticket.update(db_con, event_to_refresh.vendor_event_id)
-                            db_con.commit()
-                        elif existing_ticket.has_been_updated(found_ticket):
-                            found_ticket.update(db_con, latest_event_data.vendor_event_id)
-                            db_con.commit()
+            refresh_batch.add(latest_event_data.vendor_event_id, match_ind, latest_event_data.ticket_list,
+                              crawler.http_cache, latest_event_data.url, event_response)
+            refresh_result = "changed"
 
-            event_ids_to_mark_refreshed.append(latest_event_data.vendor_event_id)
+        crawlmetrics.refreshed_events.labels(crawler.vendor_id, refresh_result).inc()
+        num_refreshed += 1
 
-        event_to_refresh  = None
-        latest_event_data = None
-        gc.collect()
+    for refresh_batch in refresh_batches.values():
+        refresh_batch.flush()
 
-    # now mark all events refreshed
-    if event_ids_to_mark_refreshed:
-        with db_con.cursor() as cur1:
-            cur1.callproc("ozevnts.mark_events_refreshed", [event_ids_to_mark_refreshed])
-            db_con.commit()
+    return num_refreshed
 
 
 def run():
     """ Performs one refresh cycle."""
-    with psycopg2.connect(dbconnector.DbConnector.get_db_str("util")) as conn:
+    db_str = dbconnector.DbConnector.get_db_str("util")
+
+    # events are streamed from their own connection, as committing refreshed
+    # batches would close the cursor they're read from
+    with psycopg2.connect(db_str) as conn, psycopg2.connect(db_str) as read_conn:
         crawler_fact = crawlerfactory.CrawlerFactory(conn)
 
         logging.info("Commencing refresh cycle..")
-        events_to_refresh = load_events_to_refresh(conn)
-        refresh_events(conn, crawler_fact, events_to_refresh)
+        until_time    = time.time() + refresh_horizon_sec
+        refresh_queue = RefreshQueue(crawler_fact, iter_events_to_refresh(read_conn))
+
+        with crawlmetrics.cycle_seconds.labels("refresher").time():
+            num_refreshed = refresh_events(conn, crawler_fact, refresh_queue, until_time)
+
+        logging.info("Refreshed " + str(num_refreshed) + " of " + str(refresh_queue.num_loaded) +
+                     " events read in.")
+
+        if refresh_queue or not refresh_queue.is_exhausted():
+            logging.info("Events not refreshed in time left for next cycle, " + str(len(refresh_queue)) +
+                         " of them read in.")
         logging.info("Finished refresh cycle.")
         #enable for testing memory usage
         #h = hpy()
@@ -0,0 +1,29 @@
+import sys
+import logging
+import crawlengine
+
+"""
+    Used to crawl several vendors at once in one process, see CrawlEngine.
+    Normal execution runs a process per vendor via workscheduler, or the
+    engine as a single job if its use_crawl_engine is set.
+"""
+
+args                = sys.argv[1:]
+num_parse_processes = 0
+
+# pages are parsed in a pool of this many processes, see ParsePool
+if args[:1] == ["--parse-processes"] and len(args) > 1:
+    num_parse_processes = int(args[1])
+    args                = args[2:]
+
+if len(args) < 1:
+    print "Usage: python runcrawlengine [--parse-processes <num>] <vendor_id>..."
+    print "Exiting.."
+    sys.exit(0)
+
+vendor_ids = [int(vendor_id) for vendor_id in args]
+
+logging.basicConfig(
+    filename="logs/CrawlEngine.log", filemode="w",
+    format="%(asctime)s %(threadName)s %(module)s:%(levelname)s: %(message)s", level=logging.NOTSET)
+crawlengine.run(vendor_ids, num_parse_processes)
@@ -2,10 +2,10 @@ import json
 import decimal
 import logging
 import re
-from bs4 import BeautifulSoup
 from datetime import datetime
 
 import libcrawler
+import parsing
 
 seat_selection_tag_re = re.compile("^event_seat_selection")
 ticket_type_tag_re    = re.compile("^classic_ticket_type")
@@ -126,8 +126,9 @@ class TicketmasterCrawler(libcrawler.ICrawler):
     def extract_ticket_info(self, event_info, event_page):
         logging.info("Now processing: " + event_info.url)
 
+        # whole page needed, the booking fee & event status texts can be anywhere in it
         booking_fee = decimal.Decimal("0")
-        soup        = BeautifulSoup(event_page)
+        soup        = parsing.make_soup(event_page)
 
         # find booking fee
         booking_fee_str = soup.find(text=booking_re)
@@ -183,14 +184,15 @@ class TicketmasterCrawler(libcrawler.ICrawler):
 
         return event_list
 
-    def fetch_event_url(self, url):
-        return super(TicketmasterCrawler, self).fetch_event_url(url)
+    def fetch_event_url(self, url, **kwargs):
+        return super(TicketmasterCrawler, self).fetch_event_url(url, **kwargs)
 
     def extract_event_and_ticket_info(self, event_type_id, known_urls, search_results):
         super(TicketmasterCrawler, self).extract_event_and_ticket_info(event_type_id, known_urls, search_results)
 
-    def process_search_url(self, event_type_id, search_url, paginated_ind):
-        super(TicketmasterCrawler, self).process_search_url(event_type_id, search_url, paginated_ind)
+    def process_search_url(self, event_type_id, search_url, paginated_ind, full_sweep):
+        return super(TicketmasterCrawler, self).process_search_url(event_type_id, search_url, paginated_ind,
+                                                                   full_sweep)
 
     def run(self):
         super(TicketmasterCrawler, self).run()
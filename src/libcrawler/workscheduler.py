@@ -1,11 +1,18 @@
 import logging
 import datetime
 import time
-import gc
+import Queue
+import resource
+import threading
+import multiprocessing
 import psycopg2
 
 from util import dbconnector
+from util import metrics
 import crawlerfactory
+import crawlengine
+import httpcache
+import parsepool
 import refresher
 
 
@@ -18,70 +25,220 @@ def run_crawler(crawler_id):
             error_msg = "No crawler found for crawler_id: " + str(crawler_id)
             logging.error(error_msg)
             raise Exception(error_msg)
+        elif crawl_parse_processes > 0:
+            crawler.parse_pool = parsepool.ParsePool(crawl_parse_processes)
+
+            try:
+                crawler.run()
+            finally:
+                crawler.parse_pool.close()
         else:
             crawler.run()
 
 
+def run_crawl_engine(dummy):
+    crawlengine.run(crawl_engine_vendor_ids, crawl_parse_processes)
+
+
 def run_refresher(dummy):
     refresher.run()
 
 
+def run_archiver(dummy):
+    with psycopg2.connect(dbconnector.DbConnector.get_db_str("util")) as conn:
+        with conn.cursor() as cur1:
+            cur1.callproc("ozevnts.archive_past_events", [archive_after])
+            archived_events = cur1.fetchall()
+
+    logging.info("Archived " + str(len(archived_events)) + " past events.")
+
+    # archived events' pages are never fetched again, so their http cache entries go too
+    http_caches = {}
+
+    for vendor_id, url in archived_events:
+        if vendor_id not in http_caches:
+            http_caches[vendor_id] = httpcache.vendor_http_cache(vendor_id)
+
+        http_caches[vendor_id].remove(url)
+
+
 class ExecItem:
-    def __init__(self, last_exec_fin_time, sec_between_execs, func_ref):
+    def __init__(self, last_exec_fin_time, sec_between_execs, func_ref, priority=False):
         self.last_exec_fin_time = last_exec_fin_time
         self.sec_between_execs  = sec_between_execs
         self.func_ref           = func_ref
+        self.priority           = priority
+        self.process            = None
+
+
+job_failures = metrics.Counter("ozevnts_job_failures_total", "Jobs which exited with an error, by exec id.",
+                               ("exec_id",))
+
+
+def report_metrics(metrics_queue):
+    """ Sends the metrics a job has recorded since its last report to the scheduler. """
+    metrics_queue.put(metrics.snapshot(reset=True))
+
+
+def report_metrics_periodically(metrics_queue):
+    while True:
+        time.sleep(metrics_report_sec)
+        report_metrics(metrics_queue)
+
+
+def exec_job(exec_id, func_ref, metrics_queue):
+    """ 
+        Runs a job in its own worker process, capping the memory it can use. The job's
+        metrics are reported back every metrics_report_sec & once it's done, to be
+        merged into the scheduler's (see merge_job_metrics).
+    """
+    resource.setrlimit(resource.RLIMIT_AS, (job_mem_limit_bytes, job_mem_limit_bytes))
+
+    # the fork copied the scheduler's merged totals, which aren't this job's to report
+    metrics.reset()
+    report_thread = threading.Thread(target=report_metrics_periodically, args=(metrics_queue,))
+    report_thread.daemon = True
+    report_thread.start()
+
+    try:
+        func_ref(exec_id)
+    finally:
+        report_metrics(metrics_queue)
+
+
+def merge_job_metrics(metrics_queue):
+    """ Merges all metrics reported by jobs so far into the scheduler's. """
+    while True:
+        try:
+            metrics.merge(metrics_queue.get_nowait())
+        except Queue.Empty:
+            return
 
 
 # work scheduler execution starts here
-# ensures only 1 crawler/refresher running at once
-# to minimise memory usage
+# runs each job in its own process, at most max_concurrent_jobs at once.
+# a job never overlaps with itself, and unless max_concurrent_jobs is 1,
+# one slot is kept for priority jobs so long crawls can't delay refreshes.
+# the other slots let all 3 crawlers run at once, each up to job_mem_limit_bytes.
+max_concurrent_jobs = 4
+
+# address space limit for each job's process, exceeding it raises MemoryError in that job
+job_mem_limit_bytes = 1024*1024*1024
+
+# how often to check for finished jobs while others are running
+poll_sec = 5
+
+# local port the scheduler serves its jobs' metrics on, in the prometheus text format
+metrics_port = 9187
+
+# how often running jobs report their metrics to the scheduler
+metrics_report_sec = 60
+
+# crawlers parse pages in a pool of this many processes, so parsing isn't held to one core.
+# 0 parses in the crawler's own process. with concurrent jobs, leave cores for the others.
+crawl_parse_processes = 0
+
+# crawl these vendors together in one CrawlEngine job rather than a job each. the engine
+# shares its fetch & parse workers between them, but they share one job's memory cap too.
+use_crawl_engine        = False
+crawl_engine_vendor_ids = [1, 2, 3]
+
+# how long after they've finished events are moved to the archive tables
+archive_after = "1 day"
+
 exec_ids = [0,  # refresher,
             1,  # crawler: moshtix,
             2,  # crawler: oztix,
-            3]  # crawler: ticketmaster
+            3,  # crawler: ticketmaster
+            4]  # archiver
 
-# maps ids to execute against last exec finish time, time (sec) between execs, and reference run() function
-exec_time_map = {0: ExecItem(None, 60*20,   run_refresher),
+if use_crawl_engine:
+    exec_ids = [0,  # refresher,
+                5,  # crawl engine: crawl_engine_vendor_ids
+                4]  # archiver
+
+# maps ids to execute against last exec finish time, time (sec) between execs, reference run() function
+# and whether it is a priority job
+exec_time_map = {0: ExecItem(None, 30,      run_refresher, True),
                  1: ExecItem(None, 60*60*4, run_crawler),
                  2: ExecItem(None, 60*60*4, run_crawler),
-                 3: ExecItem(None, 60*60*4, run_crawler)}
+                 3: ExecItem(None, 60*60*4, run_crawler),
+                 4: ExecItem(None, 60*60*24, run_archiver),
+                 5: ExecItem(None, 60*60*4, run_crawl_engine)}
 
 logging.basicConfig(
     filename="logs/WorkScheduler.log", filemode="w",
     format="%(asctime)s %(module)s:%(levelname)s: %(message)s", level=logging.NOTSET)
 
+metrics_queue = multiprocessing.Queue()
+metrics.start_http_server(metrics_port)
+
 while True:
-    min_next_exec_time = None
+    min_next_exec_time      = None
+    num_running             = 0
+    num_running_nonpriority = 0
+
+    # a finished job's final report is in by the time it's reaped, or at worst by the next poll
+    merge_job_metrics(metrics_queue)
 
+    # reap finished jobs first, freeing their slots
     for exec_id in exec_ids:
         exec_item = exec_time_map.get(exec_id)
-        time_now  = datetime.datetime.now()
 
-        if exec_item.last_exec_fin_time is None or (
-            time_now - datetime.timedelta(
-                seconds=exec_item.sec_between_execs) >= exec_item.last_exec_fin_time):
+        if exec_item.process is not None:
+            if exec_item.process.is_alive():
+                num_running += 1
+
+                if not exec_item.priority:
+                    num_running_nonpriority += 1
+            else:
+                exec_item.process.join()
+
+                if exec_item.process.exitcode != 0:
+                    job_failures.labels(exec_id).inc()
+                    logging.error("Job " + str(exec_id) + " failed with exit code: " + str(exec_item.process.exitcode))
 
-            exec_item.func_ref(exec_id)
+                exec_item.process            = None
+                exec_item.last_exec_fin_time = datetime.datetime.now()
 
-            time_now = datetime.datetime.now()
-            exec_item.last_exec_fin_time = time_now
+    for exec_id in exec_ids:
+        exec_item = exec_time_map.get(exec_id)
+
+        if exec_item.process is not None:
+            continue
 
-            gc.collect()
-            next_exec_time = time_now + datetime.timedelta(seconds=exec_item.sec_between_execs)
+        time_now = datetime.datetime.now()
 
-            if min_next_exec_time is None or next_exec_time < min_next_exec_time:
-                min_next_exec_time = next_exec_time
+        if exec_item.last_exec_fin_time is None:
+            next_exec_time = time_now
         else:
             next_exec_time = exec_item.last_exec_fin_time + datetime.timedelta(seconds=exec_item.sec_between_execs)
 
-            if min_next_exec_time is None or next_exec_time < min_next_exec_time:
-                min_next_exec_time = next_exec_time
-
-    # if next job to execute is in the future, sleep until that time
+        # priority jobs can take any free slot, the rest leave one of them free
+        if exec_item.priority or max_concurrent_jobs == 1:
+            slot_free = num_running < max_concurrent_jobs
+        else:
+            slot_free = num_running_nonpriority < max_concurrent_jobs - 1
+
+        if next_exec_time <= time_now and slot_free:
+            logging.info("Starting job " + str(exec_id))
+            exec_item.process = multiprocessing.Process(target=exec_job,
+                                                        args=(exec_id, exec_item.func_ref, metrics_queue))
+            exec_item.process.start()
+            num_running += 1
+
+            if not exec_item.priority:
+                num_running_nonpriority += 1
+        elif next_exec_time > time_now and (min_next_exec_time is None or next_exec_time < min_next_exec_time):
+            min_next_exec_time = next_exec_time
+
+    # while jobs are running keep polling for them to finish,
+    # otherwise sleep until the next job is due
     time_now = datetime.datetime.now()
 
-    if min_next_exec_time > time_now:
+    if num_running > 0:
+        time.sleep(poll_sec)
+    elif min_next_exec_time is not None and min_next_exec_time > time_now:
         time_delta = min_next_exec_time - time_now
         sleep_sec  = time_delta.total_seconds()+1
 
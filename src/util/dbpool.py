@@ -0,0 +1,135 @@
+import os
+import time
+import logging
+import threading
+import contextlib
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import pool
+import metrics
+
+pool_wait_sec   = metrics.Histogram("ozevnts_db_pool_wait_seconds",
+                                    "Time spent waiting to check a connection out of the db pool.")
+pool_in_use     = metrics.Gauge("ozevnts_db_pool_connections_in_use", "Db pool connections currently checked out.")
+pool_reconnects = metrics.Counter("ozevnts_db_pool_reconnects_total",
+                                  "Pooled connections found broken & replaced with new ones.")
+
+
+class DbPool(object):
+    """
+        Bounded pool of db connections shared by all threads of a process. Checkouts
+        wait for a free connection rather than failing when the pool is exhausted,
+        and connections are health checked on checkout & replaced if broken.
+        With unicode_results text is returned as unicode rather than utf-8 strs.
+    """
+
+    def __init__(self, db_str, min_size=1, max_size=5, health_check_idle_sec=30, unicode_results=False):
+        self.pool                  = pool.ThreadedConnectionPool(min_size, max_size, db_str)
+        self.slots                 = threading.BoundedSemaphore(max_size)
+        self.max_size              = max_size
+        self.unicode_results       = unicode_results
+        self.health_check_idle_sec = health_check_idle_sec
+        # id(connection) -> time it was last returned to the pool
+        self.idle_since = {}
+
+    def is_healthy(self, db_con):
+        if db_con.closed:
+            return False
+
+        # only ping connections which have sat idle long enough to have been dropped
+        if time.time() - self.idle_since.get(id(db_con), 0) < self.health_check_idle_sec:
+            return True
+
+        try:
+            with db_con.cursor() as cur1:
+                cur1.execute("select 1")
+            db_con.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError), e:
+            logging.warning("Discarding broken pooled db connection: " + str(e))
+            return False
+
+    def checkout(self):
+        """ 
+            A healthy connection, broken ones being discarded till one comes back. After a db
+            restart every idle connection is broken, so once those are gone a new one's opened.
+        """
+        for attempt in range(self.max_size + 1):
+            db_con = self.pool.getconn()
+
+            if self.is_healthy(db_con):
+                break
+
+            pool_reconnects.inc()
+            self.idle_since.pop(id(db_con), None)
+            self.pool.putconn(db_con, close=True)
+        else:
+            error_msg = "No healthy db connection after " + str(self.max_size + 1) + " attempts"
+            logging.error(error_msg)
+            raise Exception(error_msg)
+
+        if self.unicode_results:
+            # cheap, and covers connections the pool has only just opened
+            psycopg2.extensions.register_type(psycopg2.extensions.UNICODE, db_con)
+            psycopg2.extensions.register_type(psycopg2.extensions.UNICODEARRAY, db_con)
+
+        return db_con
+
+    def checkin(self, db_con):
+        if db_con.closed:
+            self.idle_since.pop(id(db_con), None)
+            self.pool.putconn(db_con, close=True)
+        else:
+            self.idle_since[id(db_con)] = time.time()
+            self.pool.putconn(db_con)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+            Checks out a connection for the with block, committing on success and
+            rolling back on error (like a psycopg2 connection's own with block).
+        """
+        wait_start = time.time()
+        self.slots.acquire()
+        pool_wait_sec.observe(time.time() - wait_start)
+        pool_in_use.inc()
+
+        try:
+            db_con = self.checkout()
+
+            try:
+                yield db_con
+                db_con.commit()
+            except:
+                if not db_con.closed:
+                    try:
+                        db_con.rollback()
+                    except psycopg2.Error:
+                        # connection dropped mid request, let the next checkout replace it
+                        db_con.close()
+                raise
+            finally:
+                self.checkin(db_con)
+        finally:
+            pool_in_use.dec()
+            self.slots.release()
+
+
+db_pool      = None
+db_pool_pid  = None
+db_pool_lock = threading.Lock()
+
+
+def get_db_pool(db_str, unicode_results=False):
+    """
+        The process' pool, created on first use. Created per pid so a pool created
+        before worker processes are forked is never shared between them.
+    """
+    global db_pool, db_pool_pid
+
+    with db_pool_lock:
+        if db_pool is None or db_pool_pid != os.getpid():
+            db_pool     = DbPool(db_str, unicode_results=unicode_results)
+            db_pool_pid = os.getpid()
+
+    return db_pool
@@ -0,0 +1,289 @@
+"""
+    Minimal process-local metrics, rendered in the Prometheus text exposition format.
+    Metrics can be split by labels, eg. per vendor, and a process' metrics can be
+    snapshotted & merged into another's, eg. worker processes into their scheduler's.
+"""
+
+import time
+import threading
+import contextlib
+import BaseHTTPServer
+
+registry = []
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value))
+
+
+def format_labels(label_pairs):
+    if not label_pairs:
+        return ""
+
+    return "{" + ",".join(label_name + '="' + label_value.replace("\\", "\\\\").replace('"', '\\"').replace(
+        "\n", "\\n") + '"' for label_name, label_value in label_pairs) + "}"
+
+
+class CounterValue(object):
+    """ Value of a counter, or of one combination of its label values. """
+
+    def __init__(self):
+        self.value = 0
+        self.lock  = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name):
+        return [(name, [], self.value)]
+
+    def state(self, reset=False):
+        with self.lock:
+            state = self.value
+
+            if reset:
+                self.value = 0
+
+        return state
+
+    def merge(self, state):
+        self.inc(state)
+
+
+class GaugeValue(CounterValue):
+    """ Value of a gauge, which can go up & down. Merging takes the merged value. """
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def state(self, reset=False):
+        return self.value
+
+    def merge(self, state):
+        self.set(state)
+
+
+class HistogramValue(object):
+    """ Distribution of observed values over fixed (cumulative) buckets, eg. timings in seconds. """
+
+    def __init__(self, buckets):
+        self.buckets      = buckets
+        self.bucket_count = [0] * len(buckets)
+        self.sum          = 0
+        self.count        = 0
+        self.lock         = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            for idx, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    self.bucket_count[idx] += 1
+
+            self.sum   += value
+            self.count += 1
+
+    @contextlib.contextmanager
+    def time(self):
+        """ Observes how long the with block took, in seconds. """
+        start_time = time.time()
+
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start_time)
+
+    def samples(self, name):
+        with self.lock:
+            samples = [(name + "_bucket", [("le", format_value(upper_bound))], self.bucket_count[idx])
+                       for idx, upper_bound in enumerate(self.buckets)]
+            samples.append((name + "_sum",   [], self.sum))
+            samples.append((name + "_count", [], self.count))
+
+        return samples
+
+    def state(self, reset=False):
+        with self.lock:
+            state = [list(self.bucket_count), self.sum, self.count]
+
+            if reset:
+                self.bucket_count = [0] * len(self.buckets)
+                self.sum          = 0
+                self.count        = 0
+
+        return state
+
+    def merge(self, state):
+        with self.lock:
+            self.bucket_count = [count + merged_count for count, merged_count in zip(self.bucket_count, state[0])]
+            self.sum         += state[1]
+            self.count       += state[2]
+
+
+class Metric(object):
+    """
+        A registered metric, holding a value per combination of its label values
+        (see labels), or a single value if it has no labels.
+    """
+
+    metric_type = None
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name        = name
+        self.help_text   = help_text
+        self.label_names = tuple(label_names)
+        self.values      = {}
+        self.lock        = threading.Lock()
+        registry.append(self)
+
+    def new_value(self):
+        return
+
+    def labels(self, *label_values):
+        """ The value for the given label values, in the order of label_names. """
+        if len(label_values) != len(self.label_names):
+            raise ValueError("Metric " + self.name + " expects labels: " + str(self.label_names))
+
+        label_values = tuple(str(label_value) for label_value in label_values)
+
+        with self.lock:
+            value = self.values.get(label_values)
+
+            if value is None:
+                value = self.values[label_values] = self.new_value()
+
+        return value
+
+    def items(self):
+        with self.lock:
+            return sorted(self.values.items())
+
+
+class Counter(Metric):
+    """ Monotonically increasing count. """
+
+    metric_type = "counter"
+
+    def new_value(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """ Value which can go up & down. """
+
+    metric_type = "gauge"
+
+    def new_value(self):
+        return GaugeValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    """ Distribution of observed values, see HistogramValue. """
+
+    metric_type     = "histogram"
+    default_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, help_text, label_names=(), buckets=default_buckets):
+        super(Histogram, self).__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def new_value(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+def render_text():
+    """ All registered metrics in the Prometheus text format. """
+    lines = []
+
+    for metric in registry:
+        lines.append("# HELP " + metric.name + " " + metric.help_text)
+        lines.append("# TYPE " + metric.name + " " + metric.metric_type)
+
+        for label_values, value in metric.items():
+            for sample_name, sample_labels, sample_value in value.samples(metric.name):
+                label_pairs = zip(metric.label_names, label_values) + sample_labels
+                lines.append(sample_name + format_labels(label_pairs) + " " + format_value(sample_value))
+
+    return "\n".join(lines) + "\n"
+
+
+def snapshot(reset=False):
+    """
+        Picklable state of all registered metrics, for merging into another process'.
+        With reset counters & histograms restart from zero, so a series of snapshots
+        each hold only what was recorded since the previous one.
+    """
+    return dict((metric.name, [(label_values, value.state(reset)) for label_values, value in metric.items()])
+                for metric in registry)
+
+
+def merge(metrics_snapshot):
+    """ Adds a snapshot to this process' metrics, ignoring metrics it doesn't have registered. """
+    metrics_by_name = dict((metric.name, metric) for metric in registry)
+
+    for name, values in metrics_snapshot.items():
+        metric = metrics_by_name.get(name)
+
+        if metric is not None:
+            for label_values, state in values:
+                metric.labels(*label_values).merge(state)
+
+
+def reset():
+    """
+        Restarts all metrics from nothing, eg. in a newly forked worker process. Locks are
+        replaced rather than taken, as they may have been held by the forking process' threads.
+    """
+    for metric in registry:
+        metric.lock   = threading.Lock()
+        metric.values = {}
+
+
+class MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        response_text = render_text()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(response_text)))
+        self.end_headers()
+        self.wfile.write(response_text)
+
+    def log_message(self, format, *args):
+        # keep scrapes out of the logs
+        return
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """ Serves render_text from a background thread, on any path. """
+    http_server   = BaseHTTPServer.HTTPServer((host, port), MetricsRequestHandler)
+    server_thread = threading.Thread(target=http_server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    return http_server
@@ -0,0 +1,95 @@
+import time
+import threading
+import metrics
+
+cache_hits   = metrics.Counter("ozevnts_page_cache_hits_total",   "Pages served from the page cache.")
+cache_misses = metrics.Counter("ozevnts_page_cache_misses_total", "Pages rendered because they weren't cached.")
+
+
+class PageCache(object):
+    """
+        In-memory cache of rendered pages, eg. one per template. Entries expire after
+        ttl_sec, or once the db's data version has moved on from the version they
+        were rendered at. The data version is only checked every version_check_sec,
+        so pages are served straight from memory between checks. renders maps keys
+        being rendered to an Event set once they're done.
+    """
+
+    def __init__(self, ttl_sec=300, version_check_sec=15):
+        self.ttl_sec            = ttl_sec
+        self.version_check_sec  = version_check_sec
+        self.entries            = {}
+        self.renders            = {}
+        self.data_version       = None
+        self.version_check_time = 0
+        self.lock               = threading.Lock()
+
+    def current_data_version(self, load_data_version):
+        """
+            The data version, reloaded by one request every version_check_sec. It's loaded
+            outside the lock, other requests carrying on with the last version meanwhile.
+        """
+        with self.lock:
+            time_now     = time.time()
+            check_due    = time_now - self.version_check_time >= self.version_check_sec
+            data_version = self.data_version
+
+            if check_due:
+                # claimed before loading so only this request checks
+                self.version_check_time = time_now
+
+        if check_due or data_version is None:
+            data_version = load_data_version()
+
+            with self.lock:
+                # versions only go up, a slower concurrent load mustn't wind it back
+                self.data_version = max(self.data_version, data_version)
+                data_version      = self.data_version
+
+        return data_version
+
+    def get(self, key, load_data_version, render_page):
+        """ 
+            Returns the cached page for key, calling render_page to (re)render it if it isn't current.
+            Only one request renders a key at a time: meanwhile others are served its previous
+            page, or wait for the render if there isn't one yet.
+        """
+        # version read before rendering, so anything changed mid render is re-rendered next time
+        data_version = self.current_data_version(load_data_version)
+
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+
+                if entry is not None and entry[0] == data_version and time.time() - entry[1] < self.ttl_sec:
+                    cache_hits.inc()
+                    return entry[2]
+
+                render_done = self.renders.get(key)
+
+                if render_done is None:
+                    render_done       = threading.Event()
+                    self.renders[key] = render_done
+                    break
+                elif entry is not None:
+                    cache_hits.inc()
+                    return entry[2]
+
+            # the render may have failed or be of an older version, in which case this request renders
+            render_done.wait()
+
+        cache_misses.inc()
+
+        try:
+            render_time = time.time()
+            page        = render_page()
+
+            with self.lock:
+                self.entries[key] = (data_version, render_time, page)
+        finally:
+            with self.lock:
+                del self.renders[key]
+
+            render_done.set()
+
+        return page